@@ -0,0 +1,157 @@
+"""
+Synthetic compiler emitting gcc, clang or pdflatex style output.
+
+    python compiler.py gcc --lines 100000 --rate 0 --errors 0.05
+
+A rate of 0 writes as fast as the pipe allows, otherwise output is paced
+to the given number of lines per second.
+"""
+
+import argparse
+import random
+import sys
+import time
+
+IDENTIFIERS = ["value", "buffer", "count", "make_shared", "iterator", "result", "node"]
+TYPES = ["std::vector<int>", "std::map<std::string, int>", "const char*", "Node&", "size_t"]
+
+def _source(rng):
+    return "src/{}/{}_{}.cpp".format(
+        rng.choice(["core", "render", "net", "io"]),
+        rng.choice(["module", "parser", "buffer", "session"]),
+        rng.randrange(64))
+
+def _header(rng):
+    return "include/{}_{}.hpp".format(rng.choice(["util", "types", "traits"]), rng.randrange(16))
+
+def _code(rng):
+    return "    auto {} = {}({});".format(
+        rng.choice(IDENTIFIERS), rng.choice(IDENTIFIERS), rng.choice(IDENTIFIERS))
+
+def gcc_error(rng):
+    file, line, column = _source(rng), rng.randrange(1, 2000), rng.randrange(1, 60)
+    kind = rng.random()
+
+    if kind < 0.3:
+        return [
+            "In file included from {}:3:0,\n".format(_header(rng)),
+            "                 from {}:1:\n".format(file),
+            "{}:{}:{}: error: '{}' was not declared in this scope\n".format(
+                _header(rng), line, column, rng.choice(IDENTIFIERS)),
+            _code(rng) + "\n",
+            " " * (column % 12 + 4) + "^~~~~\n"]
+    elif kind < 0.6:
+        return [
+            "{}:{}:{}: error: no matching function for call to '{}({})'\n".format(
+                file, line, column, rng.choice(IDENTIFIERS), rng.choice(TYPES)),
+            _code(rng) + "\n",
+            " " * (column % 12 + 4) + "~~~~~^~~~~~\n",
+            " " * (column % 12 + 10) + rng.choice(IDENTIFIERS) + "\n"]
+    elif kind < 0.85:
+        return [
+            "{}:{}:{}: warning: unused variable '{}' [-Wunused-variable]\n".format(
+                file, line, column, rng.choice(IDENTIFIERS)),
+            _code(rng) + "\n",
+            " " * (column % 12 + 4) + "^\n"]
+    else:
+        return [
+            "{}:{}:{}: note: candidate: 'template<class T> {} {}(T&&)'\n".format(
+                _header(rng), line, column, rng.choice(TYPES), rng.choice(IDENTIFIERS))]
+
+def gcc_noise(rng):
+    return ["g++ -std=c++17 -O2 -Iinclude -c {} -o build/{}.o\n".format(
+        _source(rng), rng.randrange(1000))]
+
+def clang_error(rng):
+    file, line, column = _source(rng), rng.randrange(1, 2000), rng.randrange(1, 60)
+    return [
+        "{}:{}:{}: error: use of undeclared identifier '{}'\n".format(
+            file, line, column, rng.choice(IDENTIFIERS)),
+        _code(rng) + "\n",
+        " " * (column % 12 + 4) + "^\n",
+        "1 error generated.\n"]
+
+def clang_noise(rng):
+    return ["clang++ -std=c++17 -O2 -Iinclude -c {}\n".format(_source(rng))]
+
+LATEX_NOISE = [
+    "This is pdfTeX, Version 3.14159265-2.6-1.40.18 (TeX Live 2017) (preloaded format=pdflatex)\n",
+    " restricted \\write18 enabled.\n",
+    "entering extended mode\n",
+    "LaTeX2e <2017-04-15>\n",
+    "Babel <3.12> and hyphenation patterns for 3 languages loaded.\n",
+    "(/usr/share/texlive/texmf-dist/tex/latex/base/article.cls\n",
+    "Document Class: article 2014/09/29 v1.4h Standard LaTeX document class\n",
+    "(/usr/share/texlive/texmf-dist/tex/latex/base/size10.clo))\n",
+    "(/usr/share/texlive/texmf-dist/tex/latex/hyperref/hyperref.sty\n",
+    "Package hyperref Message: Driver (autodetected): hpdftex.\n",
+    "[1] [2] [3]\n",
+    "(Font)              Font shape `OT1/cmr/bx/sc' undefined\n",
+    ")\n",
+    "\n"]
+
+def latex_error(rng):
+    return [
+        "./main.tex:{}: Undefined control sequence.\n".format(rng.randrange(1, 500)),
+        "l.{} \\{}\n".format(rng.randrange(1, 500), rng.choice(IDENTIFIERS))]
+
+def latex_noise(rng):
+    if rng.random() < 0.1:
+        return [
+            "*" * 49 + "\n",
+            "* LaTeX warning: Reference `sec:{}' undefined\n".format(rng.choice(IDENTIFIERS)),
+            "* on input line {}.\n".format(rng.randrange(500)),
+            "* See the LaTeX manual for details.\n",
+            "*" * 49 + "\n"]
+
+    return [rng.choice(LATEX_NOISE)]
+
+STYLES = {
+    "gcc" : (gcc_error, gcc_noise),
+    "clang" : (clang_error, clang_noise),
+    "pdflatex" : (latex_error, latex_noise) }
+
+def generate(style, lines, errors = 0.05, seed = 0):
+    """Yields about `lines` lines of output where `errors` of the blocks are diagnostics."""
+    rng = random.Random(seed)
+    error, noise = STYLES[style]
+    emitted = 0
+
+    while emitted < lines:
+        block = error(rng) if rng.random() < errors else noise(rng)
+
+        for line in block:
+            yield line
+
+        emitted += len(block)
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("style", choices = sorted(STYLES))
+    parser.add_argument("--lines", type = int, default = 10000)
+    parser.add_argument("--rate", type = float, default = 0.0, help = "lines per second, 0 for unlimited")
+    parser.add_argument("--errors", type = float, default = 0.05)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--stderr", action = "store_true", help = "write diagnostics to stderr")
+    parser.add_argument("--exit-code", type = int, default = 1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    out = sys.stdout
+
+    for index, line in enumerate(generate(args.style, args.lines, args.errors, args.seed)):
+        stream = sys.stderr if args.stderr and ": error: " in line else out
+        stream.write(line)
+
+        if args.rate:
+            delay = start + index / args.rate - time.perf_counter()
+
+            if delay > 0:
+                out.flush()
+                time.sleep(delay)
+
+    out.flush()
+    sys.exit(args.exit_code)
+
+if __name__ == "__main__":
+    main()
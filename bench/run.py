@@ -0,0 +1,248 @@
+"""
+Headless benchmarks of the build output pipeline.
+
+    python bench/run.py [--quick] [--json results.json] [--baseline results.json]
+
+The plugin modules are imported as the `User` package against the
+Sublime Text stand-in next to this file. With --baseline, timings are
+compared against a previous --json run and the runner exits with status 1
+if any benchmark got slower than the tolerance allows.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.dirname(BENCH_DIR)
+COMPILER = os.path.join(BENCH_DIR, "compiler.py")
+
+sys.path.insert(0, BENCH_DIR)
+
+package = types.ModuleType("User")
+package.__path__ = [PACKAGE_DIR]
+sys.modules["User"] = package
+
+import sublime
+import compiler
+
+from User.build import *
+from User.latex import MinionBuildLatexCommand
+from User.output import *
+from User.super_exec import SuperExecCommand
+
+FILE_REGEX = "^(..[^:]*):([0-9]+):?([0-9]+)?:? (.*)$"
+
+def compiler_command(style, lines):
+    return [sys.executable, COMPILER, style, "--lines", str(lines)]
+
+def generated(style, lines):
+    return "".join(compiler.generate(style, lines))
+
+def wait_for_builds():
+    scheduler = MinionGenericBuildCommand.scheduler
+    sublime.run_loop(lambda: not scheduler.running and not scheduler.pending)
+    sublime.run_loop(lambda: sublime.pending_timeouts() == 0)
+
+def bench_build_output(style, lines):
+    window = sublime.new_window()
+    config = {
+        "cmd" : compiler_command(style, lines),
+        "working_dir" : BENCH_DIR }
+
+    start = time.perf_counter()
+
+    if style == "pdflatex":
+        command = MinionBuildLatexCommand(window)
+        config["main"] = "main.tex"
+        MinionGenericBuildCommand.run_build(config, command.filter, command.on_finished, window = window)
+    else:
+        MinionGenericBuildCommand.run_build(config, window = window)
+
+    wait_for_builds()
+    elapsed = time.perf_counter() - start
+    output = OutputView.find_view(window).view
+
+    return {
+        "time" : elapsed,
+        "lines_per_second" : lines / elapsed,
+        "view_commands" : output.commands,
+        "errors" : len(MinionNextErrorCommand.errors(window).error_list) }
+
+def bench_super_exec(style, lines):
+    window = sublime.new_window()
+    command = SuperExecCommand(window)
+    finished = []
+    finish = command.finish
+
+    def on_finish(proc):
+        finish(proc)
+        finished.append(proc)
+
+    command.finish = on_finish
+
+    start = time.perf_counter()
+    command.run(cmd = compiler_command(style, lines), file_regex = FILE_REGEX, working_dir = BENCH_DIR)
+    sublime.run_loop(lambda: finished and not command.text_queue)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "time" : elapsed,
+        "lines_per_second" : lines / elapsed,
+        "view_commands" : command.output_view.commands }
+
+def bench_cancel_backlog(lines):
+    """Cancels a build with a backlog of queued lines, nearly none of them may be handed out after it."""
+    task = Task(compiler_command("gcc", lines), BENCH_DIR)
+    sublime.run_loop(lambda: task.queue.qsize() >= lines // 2)
+    backlog = task.queue.qsize()
+    iterator = iter(task)
+
+    for _ in range(10):
+        next(iterator)
+
+    start = time.perf_counter()
+    task.cancel()
+    yielded = sum(1 for _ in iterator)
+    elapsed = time.perf_counter() - start
+    task.thread.join()
+
+    assert yielded <= 1, "{} of {} queued lines yielded after cancel".format(yielded, backlog)
+
+    return {
+        "time" : elapsed,
+        "backlog" : backlog,
+        "yielded_after_cancel" : yielded }
+
+def bench_error_parse(style, lines, regex):
+    text = generated(style, lines)
+    start = time.perf_counter()
+
+    parser = ErrorParser(BENCH_DIR, regex)
+
+    for line in text.splitlines(True):
+        parser.feed(line)
+
+    parser.finish()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "time" : elapsed,
+        "lines_per_second" : lines / elapsed,
+        "errors" : len(parser.items) }
+
+def bench_ignore_filter(lines):
+    text = generated("pdflatex", lines).splitlines(True)
+    ignore = IgnoreFilter(MinionBuildLatexCommand.ignore)
+
+    start = time.perf_counter()
+    ignored = sum(1 for line in text if ignore.match(line) != None)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "time" : elapsed,
+        "lines_per_second" : lines / elapsed,
+        "ignored" : ignored }
+
+def bench_phantoms(errors):
+    window = sublime.new_window()
+    file = os.path.join(BENCH_DIR, "phantoms.cpp")
+    view = sublime.View(window, file, "int x;\n" * 4000)
+    window._views.append(view)
+    window._groups[view.id()] = (0, 0)
+    window.focus_view(view)
+
+    errors_by_file = { file : [(index % 4000 + 1, 5, "error: 'x' redeclared {}".format(index)) for index in range(errors)] }
+    phantoms = ErrorPhantoms("bench", layout = centered_phantom_layout)
+
+    start = time.perf_counter()
+    phantoms.update(window, errors_by_file)
+    first = time.perf_counter() - start
+
+    start = time.perf_counter()
+    phantoms.update(window, errors_by_file)
+    unchanged = time.perf_counter() - start
+
+    return {
+        "time" : first + unchanged,
+        "first_render" : first,
+        "unchanged_render" : unchanged,
+        "rendered" : len(view.phantoms.get("bench", [])) }
+
+def benchmarks(scale):
+    lines = int(200000 * scale)
+
+    return [
+        ("build_output_gcc", lambda: bench_build_output("gcc", lines)),
+        ("build_output_clang", lambda: bench_build_output("clang", lines)),
+        ("build_output_pdflatex", lambda: bench_build_output("pdflatex", lines)),
+        ("super_exec_gcc", lambda: bench_super_exec("gcc", lines)),
+        ("cancel_backlog", lambda: bench_cancel_backlog(lines)),
+        ("error_parse_default", lambda: bench_error_parse("gcc", lines, None)),
+        ("error_parse_regex", lambda: bench_error_parse("gcc", lines, FILE_REGEX)),
+        ("ignore_filter_pdflatex", lambda: bench_ignore_filter(lines)),
+        ("phantoms", lambda: bench_phantoms(int(20000 * scale))) ]
+
+def measure(function):
+    result = function()
+    sublime.reset()
+
+    tracemalloc.start()
+    function()
+    result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    sublime.reset()
+
+    return result
+
+def compare(results, baseline, tolerance):
+    regressions = []
+
+    for name, result in sorted(results.items()):
+        if name in baseline and result["time"] > baseline[name]["time"] * (1.0 + tolerance):
+            regressions.append("{}: {:.3f}s -> {:.3f}s".format(name, baseline[name]["time"], result["time"]))
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action = "store_true", help = "run with a tenth of the default sizes")
+    parser.add_argument("--filter", default = "", help = "run only benchmarks containing this string")
+    parser.add_argument("--json", help = "write results to this file")
+    parser.add_argument("--baseline", help = "compare against results written with --json")
+    parser.add_argument("--tolerance", type = float, default = 0.25)
+    args = parser.parse_args()
+
+    results = {}
+
+    for name, function in benchmarks(0.1 if args.quick else 1.0):
+        if args.filter not in name:
+            continue
+
+        result = measure(function)
+        results[name] = result
+
+        print("{:<26} {:>8.3f}s {:>12.0f} lines/s {:>8.1f} MB".format(
+            name, result["time"], result.get("lines_per_second", 0),
+            result["peak_memory"] / 2**20), flush = True)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent = 2, sort_keys = True)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+
+        for regression in regressions:
+            print("regression: " + regression)
+
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,546 @@
+"""
+Headless stand-in for the parts of the `sublime` module used by the
+plugin. Timeouts are queued and executed by `run_loop`, which plays the
+role of the UI thread.
+"""
+
+import bisect
+import heapq
+import itertools
+import os
+import re
+import tempfile
+import threading
+import time
+
+import sublime_plugin
+
+DRAW_SQUIGGLY_UNDERLINE = 256
+DRAW_NO_FILL = 32
+DRAW_NO_OUTLINE = 64
+LAYOUT_INLINE = 0
+LAYOUT_BELOW = 1
+LAYOUT_BLOCK = 2
+ENCODED_POSITION = 1
+TRANSIENT = 4
+INHIBIT_WORD_COMPLETIONS = 8
+INHIBIT_EXPLICIT_COMPLETIONS = 16
+DYNAMIC_COMPLETIONS = 32
+
+LINE_HEIGHT = 16.0
+
+_timeouts = []
+_timeouts_mutex = threading.Lock()
+_timeouts_sequence = itertools.count()
+_settings = {}
+_cache_path = os.path.join(tempfile.gettempdir(), "minion-bench-cache")
+
+def version():
+    return "3211"
+
+def platform():
+    return "linux"
+
+def cache_path():
+    return _cache_path
+
+def packages_path():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def set_timeout(callback, delay = 0):
+    with _timeouts_mutex:
+        due = time.perf_counter() + delay / 1000
+        heapq.heappush(_timeouts, (due, next(_timeouts_sequence), callback))
+
+def set_timeout_async(callback, delay = 0):
+    timer = threading.Timer(delay / 1000, callback)
+    timer.daemon = True
+    timer.start()
+
+def run_loop(until, timeout = 60.0):
+    """Runs queued timeouts on the calling thread until `until()` holds."""
+    deadline = time.perf_counter() + timeout
+
+    while not until():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("run_loop timed out")
+
+        callback = None
+
+        with _timeouts_mutex:
+            if _timeouts and _timeouts[0][0] <= time.perf_counter():
+                callback = heapq.heappop(_timeouts)[2]
+
+        if callback:
+            callback()
+        else:
+            time.sleep(0.0005)
+
+def pending_timeouts():
+    with _timeouts_mutex:
+        return len(_timeouts)
+
+def status_message(message):
+    pass
+
+def error_message(message):
+    print("error:", message)
+
+def message_dialog(message):
+    print(message)
+
+def expand_variables(value, variables):
+    return value
+
+class Settings:
+    def __init__(self, values = None):
+        self.values = dict(values or {})
+
+    def get(self, key, default = None):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+    def has(self, key):
+        return key in self.values
+
+    def erase(self, key):
+        self.values.pop(key, None)
+
+def load_settings(name):
+    if name not in _settings:
+        _settings[name] = Settings()
+
+    return _settings[name]
+
+class Region:
+    def __init__(self, a, b = None):
+        self.a = a
+        self.b = a if b == None else b
+
+    def __repr__(self):
+        return "Region({}, {})".format(self.a, self.b)
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and (self.a, self.b) == (other.a, other.b)
+
+    def __len__(self):
+        return self.size()
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return abs(self.b - self.a)
+
+    def empty(self):
+        return self.a == self.b
+
+    def contains(self, x):
+        if isinstance(x, Region):
+            return self.begin() <= x.begin() and x.end() <= self.end()
+
+        return self.begin() <= x <= self.end()
+
+class Edit:
+    pass
+
+class Phantom:
+    def __init__(self, region, content, layout, on_navigate = None):
+        self.region = region
+        self.content = content
+        self.layout = layout
+        self.on_navigate = on_navigate
+
+class PhantomSet:
+    def __init__(self, view, key = ""):
+        self.view = view
+        self.key = key
+        self.phantoms = []
+
+    def update(self, phantoms):
+        self.phantoms = list(phantoms)
+        self.view.phantoms[self.key] = self.phantoms
+
+class CompletionList:
+    def __init__(self, completions = None, flags = 0):
+        self.completions = completions
+        self.flags = flags
+
+    def set_completions(self, completions, flags = 0):
+        self.completions = completions
+        self.flags = flags
+
+_ids = itertools.count(1)
+
+class View:
+    def __init__(self, window, file_name = None, text = ""):
+        self._id = next(_ids)
+        self._window = window
+        self._file_name = file_name
+        self._name = ""
+        self._scratch = False
+        self._settings = Settings()
+        self._chunks = [text] if text else []
+        self._size = len(text)
+        self._text = None
+        self._lines = None
+        self._change_count = 0
+        self._viewport = (0.0, 0.0)
+        self.phantoms = {}
+        self.regions = {}
+        self.commands = 0
+        self._valid = True
+
+    def id(self):
+        return self._id
+
+    def is_valid(self):
+        return self._valid
+
+    def buffer_id(self):
+        return self._id
+
+    def window(self):
+        return self._window
+
+    def file_name(self):
+        return self._file_name
+
+    def name(self):
+        return self._name
+
+    def set_name(self, name):
+        self._name = name
+
+    def is_scratch(self):
+        return self._scratch
+
+    def set_scratch(self, scratch):
+        self._scratch = scratch
+
+    def is_dirty(self):
+        return False
+
+    def is_loading(self):
+        return False
+
+    def settings(self):
+        return self._settings
+
+    def assign_syntax(self, syntax):
+        self._settings.set("syntax", syntax)
+
+    def set_syntax_file(self, syntax):
+        self._settings.set("syntax", syntax)
+
+    def scope_name(self, point):
+        syntax = self._settings.get("syntax", "") or ""
+        return "source.c++ " if "C++" in syntax else "text.plain "
+
+    def change_count(self):
+        return self._change_count
+
+    def text(self):
+        if self._text == None:
+            self._text = "".join(self._chunks)
+            self._chunks = [self._text] if self._text else []
+
+        return self._text
+
+    def size(self):
+        return self._size
+
+    def substr(self, x):
+        if isinstance(x, Region):
+            return self.text()[x.begin():x.end()]
+
+        return self.text()[x:x + 1]
+
+    def _changed(self):
+        self._text = None
+        self._lines = None
+        self._change_count += 1
+
+    def insert(self, edit, point, text):
+        if point == self._size:
+            # Appending keeps the line index, only the new text is scanned.
+            lines = self._lines
+            self._chunks.append(text)
+            self._changed()
+
+            if lines != None:
+                lines.extend(point + match.end() for match in re.finditer("\n", text))
+                self._lines = lines
+        else:
+            content = self.text()
+            self._chunks = [content[:point], text, content[point:]]
+            self._changed()
+
+        self._size += len(text)
+        return len(text)
+
+    def erase(self, edit, region):
+        content = self.text()
+        self._chunks = [content[:region.begin()], content[region.end():]]
+        self._size -= region.size()
+        self._changed()
+
+    def replace(self, edit, region, text):
+        self.erase(edit, region)
+        self.insert(edit, region.begin(), text)
+
+    def _line_starts(self):
+        if self._lines == None:
+            content = self.text()
+            self._lines = [0] + [match.end() for match in re.finditer("\n", content)]
+
+        return self._lines
+
+    def rowcol(self, point):
+        lines = self._line_starts()
+        row = bisect.bisect_right(lines, point) - 1
+        return row, point - lines[row]
+
+    def text_point(self, row, col):
+        lines = self._line_starts()
+        row = max(0, min(row, len(lines) - 1))
+        return min(lines[row] + col, self._size)
+
+    def line(self, x):
+        point = x.begin() if isinstance(x, Region) else x
+        lines = self._line_starts()
+        row = bisect.bisect_right(lines, point) - 1
+        end = lines[row + 1] - 1 if row + 1 < len(lines) else self._size
+        return Region(lines[row], end)
+
+    def find(self, pattern, start, flags = 0):
+        match = re.compile(pattern).search(self.text(), start)
+        return Region(match.start(), match.end()) if match else Region(-1, -1)
+
+    def visible_region(self):
+        return Region(0, self._size)
+
+    def viewport_extent(self):
+        return (800.0, 600.0)
+
+    def viewport_position(self):
+        return self._viewport
+
+    def set_viewport_position(self, position, animate = True):
+        self._viewport = position
+
+    def text_to_layout(self, point):
+        return (0.0, self.rowcol(point)[0] * LINE_HEIGHT)
+
+    def layout_to_text(self, position):
+        return self.text_point(int(position[1] // LINE_HEIGHT), 0)
+
+    def show(self, x, show_surrounds = True):
+        pass
+
+    def show_at_center(self, x):
+        pass
+
+    def add_regions(self, key, regions, scope = "", icon = "", flags = 0):
+        self.regions[key] = regions
+
+    def erase_regions(self, key):
+        self.regions.pop(key, None)
+
+    def erase_phantoms(self, key):
+        self.phantoms.pop(key, None)
+
+    def set_status(self, key, value):
+        pass
+
+    def erase_status(self, key):
+        pass
+
+    def find_all_results_with_text(self):
+        file_regex = self._settings.get("result_file_regex")
+
+        if not file_regex:
+            return []
+
+        base = self._settings.get("result_base_dir", "")
+        compiled = re.compile(file_regex)
+        results = []
+
+        for line in self.text().split("\n"):
+            match = compiled.search(line)
+
+            if match and match.group(2):
+                groups = match.groups() + (None,) * 4
+                results.append((
+                    os.path.normpath(os.path.join(base, groups[0])),
+                    int(groups[1]),
+                    int(groups[2] or 0),
+                    groups[3] or ""))
+
+        return results
+
+    def find_all_results(self):
+        return [result[:3] for result in self.find_all_results_with_text()]
+
+    def run_command(self, name, args = None):
+        self.commands += 1
+        args = args or {}
+
+        if name == "append":
+            self.insert(Edit(), self._size, args["characters"])
+            return
+
+        command = sublime_plugin.find_command(sublime_plugin.TextCommand, name)
+
+        if command:
+            command(self).run(Edit(), **args)
+
+class Window:
+    def __init__(self, project_data = None):
+        self._id = next(_ids)
+        self._views = []
+        self._groups = {}
+        self._active = None
+        self._project_data = project_data
+        self._layout = { "rows" : [0.0, 1.0], "cols" : [0.0, 1.0], "cells" : [[0, 0, 1, 1]] }
+        self._commands = {}
+
+    def id(self):
+        return self._id
+
+    def views(self):
+        return list(self._views)
+
+    def new_file(self):
+        view = View(self)
+        self._views.append(view)
+        self._groups[view.id()] = (self.active_group(), len(self._views) - 1)
+        return view
+
+    def open_file(self, name, flags = 0):
+        file_name = name.split(":")[0] if flags & ENCODED_POSITION else name
+        view = self.find_open_file(file_name)
+
+        if view == None:
+            text = ""
+
+            if os.path.isfile(file_name):
+                with open(file_name) as file:
+                    text = file.read()
+
+            view = View(self, file_name, text)
+            self._views.append(view)
+            self._groups[view.id()] = (0, len(self._views) - 1)
+
+        self._active = view
+        return view
+
+    def find_open_file(self, file_name):
+        for view in self._views:
+            if view.file_name() == file_name:
+                return view
+
+        return None
+
+    def active_view(self):
+        return self._active
+
+    def focus_view(self, view):
+        if view != None:
+            self._active = view
+
+    def active_group(self):
+        return 0
+
+    def num_groups(self):
+        return len(self._layout["cells"])
+
+    def get_layout(self):
+        return {
+            "rows" : list(self._layout["rows"]),
+            "cols" : list(self._layout["cols"]),
+            "cells" : [list(cell) for cell in self._layout["cells"]] }
+
+    def set_layout(self, layout):
+        self._layout = layout
+
+    def views_in_group(self, group):
+        return [view for view in self._views if self._groups[view.id()][0] == group]
+
+    def active_view_in_group(self, group):
+        if self._active != None and self._groups[self._active.id()][0] == group:
+            return self._active
+
+        views = self.views_in_group(group)
+        return views[-1] if views else None
+
+    def get_view_index(self, view):
+        return self._groups.get(view.id(), (-1, -1))
+
+    def set_view_index(self, view, group, index):
+        self._groups[view.id()] = (group, index)
+
+    def close_view(self, view):
+        self._views.remove(view)
+        self._groups.pop(view.id(), None)
+        view._valid = False
+        view._window = None
+
+        if self._active == view:
+            self._active = None
+
+        for listener in sublime_plugin.all_listeners():
+            if hasattr(listener, "on_close"):
+                listener.on_close(view)
+
+    def project_data(self):
+        return self._project_data
+
+    def project_file_name(self):
+        return None
+
+    def extract_variables(self):
+        return {}
+
+    def status_message(self, message):
+        pass
+
+    def show_quick_panel(self, items, on_done, *args, **kwargs):
+        on_done(-1)
+
+    def run_command(self, name, args = None):
+        if name not in self._commands:
+            klass = sublime_plugin.find_command(sublime_plugin.WindowCommand, name)
+            self._commands[name] = klass(self) if klass else None
+
+        if self._commands[name]:
+            self._commands[name].run(**(args or {}))
+
+_windows = []
+
+def windows():
+    return list(_windows)
+
+def active_window():
+    if not _windows:
+        _windows.append(Window())
+
+    return _windows[-1]
+
+def new_window(project_data = None):
+    window = Window(project_data)
+    _windows.append(window)
+    return window
+
+def reset():
+    """Drops all windows, settings and queued timeouts."""
+    del _windows[:]
+    _settings.clear()
+
+    with _timeouts_mutex:
+        del _timeouts[:]
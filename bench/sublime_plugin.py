@@ -0,0 +1,69 @@
+"""
+Headless stand-in for the `sublime_plugin` module. Commands are looked up
+by their snake_case name among the loaded subclasses, the same way
+Sublime Text derives command names from class names.
+"""
+
+import re
+
+class Command:
+    def is_enabled(self, *args, **kwargs):
+        return True
+
+class ApplicationCommand(Command):
+    pass
+
+class WindowCommand(Command):
+    def __init__(self, window):
+        self.window = window
+
+class TextCommand(Command):
+    def __init__(self, view):
+        self.view = view
+
+class EventListener:
+    pass
+
+class ViewEventListener:
+    def __init__(self, view):
+        self.view = view
+
+    @classmethod
+    def is_applicable(klass, settings):
+        return True
+
+def command_name(klass):
+    name = klass.__name__
+
+    if name.endswith("Command"):
+        name = name[:-len("Command")]
+
+    return re.sub(r"(?<=[a-z0-9])([A-Z])", r"_\1", name).lower()
+
+def subclasses(base):
+    result = []
+    stack = [base]
+
+    while stack:
+        for klass in stack.pop().__subclasses__():
+            result.append(klass)
+            stack.append(klass)
+
+    return result
+
+def find_command(base, name):
+    for klass in subclasses(base):
+        if command_name(klass) == name:
+            return klass
+
+    return None
+
+_listeners = {}
+
+def all_listeners():
+    """Instances of every loaded EventListener, created once per class."""
+    for klass in subclasses(EventListener):
+        if klass not in _listeners:
+            _listeners[klass] = klass()
+
+    return list(_listeners.values())
@@ -1,34 +1,46 @@
 import sublime, sublime_plugin
 import subprocess, threading
 import traceback
-import re, time, copy
+import re, time
 import os
+import signal
 import queue
+import array
 import collections
+import itertools
 import html
 
 from User.output import *
+from User.telemetry import *
+from User.launcher import *
 
 class Task:
     class Sentinel:
         pass
 
+    KILL_TIMEOUT = 0.5
+
     def __init__(self, command, working_dir):
-        env = copy.copy(os.environ)
-        env["max_print_line"] = "1048576"
+        self.telemetry = BuildTelemetry(command, working_dir)
 
-        self.process = subprocess.Popen(
+        # Run the build in its own process group, so cancellation can
+        # reach every child spawned by `make -j`.
+        self.process = launch(
             command,
-            stdout = subprocess.PIPE,
-            stderr = subprocess.STDOUT,
             cwd = working_dir,
-            env = env)
+            env = { "max_print_line" : "1048576" },
+            merge_stderr = True,
+            new_session = os.name != "nt")
+
+        self.telemetry.spawned()
 
         self.queue = queue.Queue()
+        self.cancelled = threading.Event()
 
         def target():
             for item in self.process.stdout:
                 self.queue.put(item)
+                self.telemetry.received(len(item), 1, self.queue.qsize())
 
             self.process.wait()
             self.queue.put(Task.Sentinel())
@@ -38,62 +50,316 @@ class Task:
 
     def __iter__(self):
         class Generator:
-            def __init__(self, queue):
-                self.queue = queue
+            def __init__(self, task):
+                self.task = task
 
             def __iter__(self):
                 return self
 
             def __next__(self):
-                try:
-                    while True:
-                        item = self.queue.get(True, 0.5)
-                        if isinstance(item, Task.Sentinel):
-                            raise StopIteration
-                        else:
-                            return item
-                except queue.Empty:
-                    return None
-
-        return Generator(self.queue)
+                # Lines queued before a cancel are not handed out anymore.
+                if self.task.cancelled.is_set():
+                    raise StopIteration
+
+                item = self.task.queue.get()
+
+                if isinstance(item, Task.Sentinel) or self.task.cancelled.is_set():
+                    raise StopIteration
+
+                return item
+
+        return Generator(self)
+
+    def cancel(self):
+        if not self.cancelled.is_set():
+            self.cancelled.set()
+
+            # Drop the backlog, the reader may still add what the pipe holds.
+            try:
+                while True:
+                    self.queue.get_nowait()
+            except queue.Empty:
+                pass
+
+            self.queue.put(Task.Sentinel())
+            self.terminate()
 
     def terminate(self):
-        self.process.terminate()
+        if self.process.poll() != None:
+            return
+
+        if os.name == "nt":
+            subprocess.call(["taskkill", "/T", "/F", "/PID", str(self.process.pid)])
+            return
+
+        def kill(sig):
+            try:
+                os.killpg(self.process.pid, sig)
+            except ProcessLookupError:
+                pass
+
+        kill(signal.SIGTERM)
+
+        timer = threading.Timer(Task.KILL_TIMEOUT, kill, [signal.SIGKILL])
+        timer.daemon = True
+        timer.start()
 
     def return_code(self):
         return self.process.returncode
 
+class IgnoreFilter:
+    """
+    Matches lines against a list of ignore patterns. Every pattern is
+    tried as an exact string, patterns without regex syntax as literal
+    prefixes and the remaining ones as a single combined alternation,
+    except those using backreferences or inline flags, which are tried
+    one by one.
+    """
+
+    SPECIAL = set(".^$*+?{}[]\\|()")
+    FLAGS = re.compile(r"(?<!\\)\(\?[aiLmsux]+\)")
+    CACHE_SIZE = 32
+    cache = {}
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.exact = {}
+        self.prefixes = {}
+        self.combined = None
+        self.separate = []
+
+        regexes = []
+
+        for index, pattern in enumerate(patterns):
+            self.exact.setdefault(pattern.strip(), index)
+
+            if any(char in IgnoreFilter.SPECIAL for char in pattern):
+                regexes.append(index)
+            else:
+                node = self.prefixes
+
+                for char in pattern:
+                    node = node.setdefault(char, {})
+
+                node.setdefault(None, index)
+
+        # Backreferences would be renumbered inside the alternation and
+        # inline flags like (?i) would apply to every pattern in it.
+        combinable = [i for i in regexes
+            if not re.search(r"\\[1-9]", patterns[i])
+            and not IgnoreFilter.FLAGS.search(patterns[i])]
+
+        if combinable:
+            try:
+                self.combined = re.compile("|".join(
+                    "(?P<_{}>{})".format(i, patterns[i]) for i in combinable))
+            except re.error:
+                combinable = []
+
+        self.separate = [(i, re.compile(patterns[i])) for i in regexes if i not in combinable]
+
+    def match(self, text):
+        """Returns the index of the first pattern that matches `text` or None."""
+        index = self.exact.get(text)
+
+        if index != None:
+            return index
+
+        node = self.prefixes
+
+        for char in text:
+            if None in node:
+                return node[None]
+
+            node = node.get(char)
+
+            if node == None:
+                break
+        else:
+            if None in node:
+                return node[None]
+
+        found = None
+
+        if self.combined != None:
+            match = self.combined.match(text)
+
+            if match != None:
+                found = int(match.lastgroup[1:])
+
+        # Separate patterns listed before the combined hit take precedence.
+        for index, compiled in self.separate:
+            if found != None and index > found:
+                break
+
+            if compiled.match(text) != None:
+                return index
+
+        return found
+
+    def report(self, hits):
+        lines = []
+
+        for count, index in sorted(((count, index) for index, count in enumerate(hits) if count), reverse = True):
+            lines.append('[Ignored {} lines matching "{}"]\n'.format(count, self.patterns[index]))
+
+        return "".join(lines)
+
+    @classmethod
+    def get(klass, patterns):
+        if not isinstance(patterns, list):
+            patterns = [patterns]
+
+        key = tuple(patterns)
+
+        if key not in klass.cache:
+            if len(klass.cache) >= klass.CACHE_SIZE:
+                klass.cache.clear()
+
+            klass.cache[key] = IgnoreFilter(patterns)
+
+        return klass.cache[key]
+
+class BuildJob:
+    def __init__(self, target, window, config, filter, on_finished, on_cancelled, priority = 0):
+        self.target = target
+        self.window = window
+        self.lane = window.id()
+        self.config = config
+        self.filter = filter
+        self.on_finished = on_finished
+        self.on_cancelled = on_cancelled
+        self.priority = priority
+        self.sequence = 0
+        self.mutex = threading.Lock()
+        self.task = None
+        self.cancelled = False
+
+    def start(self, command, working_dir):
+        task = Task(command, working_dir)
+
+        with self.mutex:
+            self.task = task
+
+            if self.cancelled:
+                task.cancel()
+
+        return task
+
+    def cancel(self):
+        with self.mutex:
+            self.cancelled = True
+
+            if self.task:
+                self.task.cancel()
+
+class BuildScheduler:
+    """
+    Runs build jobs on their own threads. Jobs from the same window share
+    a lane and run one after another, different lanes run in parallel up
+    to the `minion_max_concurrent_builds` setting. A job's output view is
+    cleared only once it starts.
+    """
+
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.pending = []
+        self.running = {}
+        self.sequence = itertools.count()
+        self.limit = 2
+
+    def submit(self, job):
+        settings = sublime.load_settings("Preferences.sublime-settings")
+
+        with self.mutex:
+            self.limit = max(1, settings.get("minion_max_concurrent_builds", 2))
+            running = self.running.get(job.lane)
+
+            # The same build again supersedes the running one, a different
+            # build of the window (bibtex, then latex) waits for it.
+            if running != None and running.config == job.config:
+                running.cancel()
+
+            for queued in self.pending:
+                if queued.lane == job.lane and queued.config == job.config:
+                    queued.priority = max(queued.priority, job.priority)
+                    return queued
+
+            job.sequence = next(self.sequence)
+            self.pending.append(job)
+
+        self._dispatch()
+        return job
+
+    def cancel(self, lane = None):
+        with self.mutex:
+            self.pending = [job for job in self.pending
+                if lane != None and job.lane != lane]
+
+            for job in self.running.values():
+                if lane == None or job.lane == lane:
+                    job.cancel()
+
+    def _dispatch(self):
+        with self.mutex:
+            while len(self.running) < self.limit:
+                ready = [job for job in self.pending if job.lane not in self.running]
+
+                if len(ready) == 0:
+                    break
+
+                job = min(ready, key = lambda job: (-job.priority, job.sequence))
+                self.pending.remove(job)
+                self.running[job.lane] = job
+
+                thread = threading.Thread(target = self._run, args = (job,), daemon = True)
+                thread.start()
+
+    def _run(self, job):
+        try:
+            job.target(job)
+        finally:
+            with self.mutex:
+                del self.running[job.lane]
+
+            self._dispatch()
+
 class MinionGenericBuildCommand(sublime_plugin.WindowCommand):
-    worker_thread = None
-    worker_mutex = threading.Lock()
-    build_queue = queue.Queue()
+    scheduler = BuildScheduler()
 
     def __init__(self, *args):
         super().__init__(*args)
 
     def __del__(self):
-        self.cancel_build()
+        self.cancel_build(self.window)
 
-    def run(self, config = None):
-        MinionGenericBuildCommand.run_build(
-            config,
-            self.filter)
+    def run(self, config = None, priority = 0):
+        if config == None:
+            MinionGenericBuildCommand.cancel_build(self.window)
+        else:
+            MinionGenericBuildCommand.run_build(
+                config,
+                self.filter,
+                window = self.window,
+                priority = priority)
 
     @staticmethod
     def filter(panel, line, config, context):
-        if "ignore_errors" in config:
-            ignored = config["ignore_errors"]
+        ignore = context.get("ignore_filter")
 
-            if not isinstance(ignored, list):
-                ignored = [ignored]
+        if ignore == None and "ignore_errors" in config:
+            ignore = IgnoreFilter.get(config["ignore_errors"])
+            context["ignore_filter"] = ignore
+            context["ignore_hits"] = [0] * len(ignore.patterns)
 
-            for item in ignored:
-                if item.strip() == line.strip() or re.match(item, line.strip()) != None:
-                    return
+        if ignore != None:
+            index = ignore.match(line.strip())
 
-            panel.append('{}'.format(line))
-        else:
-            panel.append('{}'.format(line))
+            if index != None:
+                context["ignore_hits"][index] += 1
+                return
+
+        panel.append(line)
 
     @staticmethod
     def on_cancelled(panel, elapsed_time, config):
@@ -101,102 +367,349 @@ class MinionGenericBuildCommand(sublime_plugin.WindowCommand):
 
     @staticmethod
     def on_finished(panel, return_code, elapsed_time, config, context):
+        if "ignore_filter" in context:
+            panel.append(context["ignore_filter"].report(context["ignore_hits"]))
+
         panel.append_finish_message(
             config['cmd'],
             config['working_dir'],
             return_code,
             elapsed_time)
 
-        window = sublime.active_window()
+        window = panel.owner
         window.run_command("minion_next_result", { "action" : "init", "build_system" : config })
 
-        MinionNextErrorCommand.set_list(
-            panel.substr(sublime.Region(0, panel.size())),
-            config["working_dir"],
-            config["file_regex"] if "file_regex" in config else None);
+        MinionNextErrorCommand.finish_list(window = window)
 
 
     @classmethod
-    def run_build(klass, config, filter = None, on_finished = None, on_cancelled = None):
-        filter = filter if filter != None else MinionGenericBuildCommand.filter
-        on_finished = on_finished if on_finished else MinionGenericBuildCommand.on_finished
-        on_cancelled = on_cancelled if on_cancelled else MinionGenericBuildCommand.on_cancelled
+    def _run_job(klass, job):
+        config = job.config
+        start = time.time()
 
-        def target():
-            while True:
-                config, filter, on_finished, on_cancelled = klass.build_queue.get()
+        parser = ErrorParser(config['working_dir'], config.get("file_regex"))
+        MinionNextErrorCommand.stream_list(parser, job.window)
 
-                if config != None:
-                    start = time.time()
+        try:
+            process = job.start(config['cmd'], config['working_dir'])
 
-                    MinionNextErrorCommand.reset_list()
+            context = {}
 
-                    try:
-                        process = Task(config['cmd'], config['working_dir'])
+            output = BufferedOutput(OutputView.request(job.window), parser.feed)
+            output.clear()
+            output.append("[Building...]\n")
 
-                        context = {}
+            telemetry = process.telemetry
+            filter_time = 0.0
 
-                        output = OutputView.request()
-                        output.clear()
-                        output.append("[Building...]\n")
+            for line in process:
+                begin = time.perf_counter()
+                job.filter(output, line.decode('utf-8'), config, context)
+                filter_time += time.perf_counter() - begin
 
-                        cancelled = False
+            # Appends made by the filter are accounted for separately.
+            telemetry.filter_time = filter_time - output.append_time
 
-                        for line in process:
-                            if not klass.build_queue.empty():
-                                process.terminate()
-                                cancelled = True
-                                break
+            cancelled = process.cancelled.is_set()
+            elapsed_time = time.time() - start
 
-                            if line != None:
-                                filter(output, line.decode('utf-8'), config, context)
+            output.flush()
 
-                        elapsed_time = time.time() - start
+            if cancelled:
+                job.on_cancelled(output, elapsed_time, config)
+            else:
+                job.on_finished(output, process.return_code(), elapsed_time, config, context)
 
-                        if cancelled:
-                            on_cancelled(output, elapsed_time, config)
-                        else:
-                            on_finished(output, process.return_code(), elapsed_time, config, context)
-                    except Exception:
-                        output = OutputView.request()
-                        output.clear()
-                        output.append("[Running task {} failed.]\n".format(config['cmd']))
-                        traceback.print_exc()
+            output.flush()
+            parser.finish()
 
-        with klass.worker_mutex:
-            if klass.worker_thread == None:
-                klass.worker_thread = threading.Thread(
-                    target = target,
-                    daemon = True)
-                klass.worker_thread.start()
+            telemetry.append_time = output.flush_time
+            telemetry.parse_time = parser.parse_time
+            telemetry.finish(process.return_code(), cancelled)
+        except Exception:
+            output = OutputView.request(job.window)
+            output.clear()
+            output.append("[Running task {} failed.]\n".format(config['cmd']))
+            traceback.print_exc()
 
-        klass.build_queue.put((config, filter, on_finished, on_cancelled))
+    @classmethod
+    def run_build(klass, config, filter = None, on_finished = None, on_cancelled = None, window = None, priority = 0):
+        filter = filter if filter != None else MinionGenericBuildCommand.filter
+        on_finished = on_finished if on_finished else MinionGenericBuildCommand.on_finished
+        on_cancelled = on_cancelled if on_cancelled else MinionGenericBuildCommand.on_cancelled
+        window = window if window != None else sublime.active_window()
+
+        return klass.scheduler.submit(BuildJob(
+            klass._run_job, window, config, filter, on_finished, on_cancelled, priority))
 
     @classmethod
-    def cancel_build(klass):
-        with klass.worker_mutex:
-            if klass.worker_thread:
-                klass.build_queue.put_nowait((None, None, None, None))
+    def cancel_build(klass, window = None):
+        klass.scheduler.cancel(window.id() if window != None else None)
 
 def plugin_unloaded():
     MinionGenericBuildCommand.cancel_build()
 
 ErrorListItem = collections.namedtuple('ErrorListItem', ['file', 'line', 'column', 'source', 'message'])
 
+class ErrorList:
+    """
+    Column store of build errors. File names are interned in a table,
+    numbers live in arrays and messages are kept in shared text blocks and
+    sliced only when an item is accessed. Items are returned as
+    ErrorListItem tuples.
+    """
+
+    BLOCK_SIZE = 2**16
+
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.files = []
+        self.file_ids = {}
+        self.file = array.array('I')
+        self.line = array.array('q')
+        self.column = array.array('q')
+        self.source_begin = array.array('q')
+        self.source_end = array.array('q')
+        self.message_block = array.array('I')
+        self.message_begin = array.array('I')
+        self.message_end = array.array('I')
+        self.blocks = []
+        self.parts = []
+        self.parts_size = 0
+
+    def append(self, file, line, column, source, message):
+        with self.mutex:
+            file_id = self.file_ids.get(file)
+
+            if file_id == None:
+                file_id = len(self.files)
+                self.file_ids[file] = file_id
+                self.files.append(file)
+
+            if self.parts_size != 0 and self.parts_size + len(message) > ErrorList.BLOCK_SIZE:
+                self.blocks.append("".join(self.parts))
+                self.parts = []
+                self.parts_size = 0
+
+            self.message_block.append(len(self.blocks))
+            self.message_begin.append(self.parts_size)
+            self.parts.append(message)
+            self.parts_size += len(message)
+            self.message_end.append(self.parts_size)
+
+            self.file.append(file_id)
+            self.line.append(line)
+            self.column.append(column)
+            self.source_begin.append(source[0])
+            # Appended last, __len__ depends on it.
+            self.source_end.append(source[1])
+
+    def __len__(self):
+        return len(self.source_end)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+
+        return ErrorListItem(
+            self.files[self.file[index]],
+            self.line[index],
+            self.column[index],
+            (self.source_begin[index], self.source_end[index]),
+            self.message(index))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def by_file(self, limit = None):
+        """Returns (line, column, message) tuples of at most `limit` errors per file."""
+        result = {}
+
+        for index in range(len(self)):
+            file = self.files[self.file[index]]
+            errors = result.setdefault(file, [])
+
+            if limit == None or len(errors) < limit:
+                errors.append((self.line[index], self.column[index], self.message(index)))
+
+        return result
+
+    def message(self, index):
+        with self.mutex:
+            block = self.message_block[index]
+
+            if block == len(self.blocks):
+                text = "".join(self.parts)
+                self.parts = [text]
+            else:
+                text = self.blocks[block]
+
+            return text[self.message_begin[index]:self.message_end[index]]
+
+class ErrorParser:
+    """
+    Resumable parser of build output. Text can be fed in arbitrary chunks
+    while the build runs, errors are appended to `items` as soon as their
+    message (including gcc caret and hint lines) is complete.
+    """
+
+    def __init__(self, working_dir, regex = None):
+        self.working_dir = os.path.realpath(working_dir)
+        self.regex = re.compile(regex) if regex != None else None
+        self.items = ErrorList()
+        self.paths = {}
+        self.parse_time = 0.0
+        self.partial = ""
+        self.pending = []
+        self.offset = 0
+
+    @staticmethod
+    def split_error(line):
+        if line.startswith("In file included from "):
+            return None
+
+        if line.startswith("                 from "):
+            return None
+
+        split = line.split(":")
+
+        if 2 < len(split) and split[1].isdigit():
+            if 3 < len(split) and split[2].isdigit():
+                return (split[0], split[1], split[2], line[sum(map(len, split[0:3])) + 3:])
+            return (split[0], split[1], 0, line[sum(map(len, split[0:2])) + 2:])
+
+        return None
+
+    @staticmethod
+    def tilde_and_dash(line):
+        line = line.strip()
+        return line.count("~") + line.count("^") == len(line)
+
+    @staticmethod
+    def hint(underscore, tentative):
+        begin = len(underscore) - len(underscore.lstrip())
+        tentative_begin = len(tentative) - len(tentative.lstrip())
+
+        return (begin < tentative_begin
+            and len("".join(tentative.split())) < len(underscore) // 2)
+
+    def feed(self, text):
+        begin = time.perf_counter()
+        lines = (self.partial + text).splitlines(True)
+
+        if len(lines) != 0 and not lines[-1].endswith("\n"):
+            self.partial = lines.pop()
+        else:
+            self.partial = ""
+
+        self._parse(lines, False)
+        self.parse_time += time.perf_counter() - begin
+
+    def finish(self):
+        begin = time.perf_counter()
+        lines = [self.partial] if self.partial else []
+        self.partial = ""
+        self._parse(lines, True)
+        self.parse_time += time.perf_counter() - begin
+
+    def _parse(self, lines, final):
+        if self.regex != None:
+            for line in lines:
+                self._parse_regex(line)
+        else:
+            self.pending.extend(lines)
+            self._parse_default(final)
+
+    def _parse_regex(self, line):
+        match = self.regex.match(line)
+
+        if match:
+            match = match.groups()
+            self.items.append(
+                match[0] if len(match) > 0 else "",
+                int(match[1]) if len(match) > 1 and match[1] else 0,
+                int(match[2]) if len(match) > 2 and match[2] else 0,
+                (self.offset, self.offset + len(line)),
+                (match[3] or "") if len(match) > 3 else line.strip())
+
+        self.offset += len(line)
+
+    def _parse_default(self, final):
+        lines = self.pending
+        itr, size = 0, len(lines)
+
+        while itr < size:
+            split = ErrorParser.split_error(lines[itr])
+
+            if split:
+                # Wait for the lines that may hold the caret and the hint.
+                if itr + 2 >= size and not final:
+                    break
+
+                length = 1
+
+                if itr + 2 < size and ErrorParser.tilde_and_dash(lines[itr + 2]):
+                    if itr + 3 >= size and not final:
+                        break
+
+                    if itr + 3 < size and ErrorParser.hint(lines[itr + 2], lines[itr + 3]):
+                        length = 4
+                    else:
+                        length = 3
+
+                message = "".join(lines[itr:itr + length])
+                path = self.paths.get(split[0])
+
+                if path == None:
+                    path = os.path.realpath(os.path.join(self.working_dir, split[0]))
+                    self.paths[split[0]] = path
+
+                self.items.append(
+                    path,
+                    int(split[1]),
+                    int(split[2]),
+                    (self.offset, self.offset + len(message)), message)
+
+                self.offset += len(message)
+                itr += length
+            else:
+                self.offset += len(lines[itr])
+                itr += 1
+
+        del lines[:itr]
+
+def centered_phantom_layout(line, column, text):
+    escaped = html.escape(text, quote=False).splitlines()[0].strip()
+    return line, max(0, column - 1 - len(escaped) // 2), escaped
+
+class WindowErrors:
+    """Error list of the last build in a window and the position within it."""
+
+    def __init__(self):
+        self.error_list = []
+        self.prev_error = -1
+        self.working_dir = ""
+        self.parser = None
+        self.phantoms = ErrorPhantoms("minion", layout = centered_phantom_layout)
+
 class MinionNextErrorCommand(sublime_plugin.WindowCommand):
-    error_list = []
-    prev_error = -1
-    working_dir = ""
-    phantom_sets = {}
+    windows = {}
 
     def __init__(self, window):
         super().__init__(window)
 
+    @classmethod
+    def errors(klass, window = None):
+        window = window if window != None else sublime.active_window()
+        return window_state(klass.windows, window, WindowErrors)
+
     def _highlight(self, region):
-        panel = OutputView.request()
+        panel = OutputView.request(self.window)
+        region = panel.reveal(region[0], region[1])
 
-        if not isinstance(region, sublime.Region):
-            region = sublime.Region(region[0], region[1])
+        if region == None:
+            return
 
         panel.add_regions(
             "error", [region], "error",
@@ -206,8 +719,9 @@ class MinionNextErrorCommand(sublime_plugin.WindowCommand):
         panel.show_at_center(region)
 
     def run(self, **kwargs):
-        error_list = MinionNextErrorCommand.error_list
-        prev_error = MinionNextErrorCommand.prev_error
+        errors = MinionNextErrorCommand.errors(self.window)
+        error_list = errors.error_list
+        prev_error = errors.prev_error
 
         if len(error_list) == 0:
             sublime.status_message("No errors...")
@@ -216,11 +730,11 @@ class MinionNextErrorCommand(sublime_plugin.WindowCommand):
         direction = -1 if "forward" in kwargs and not kwargs["forward"] else +1
         current_error = (prev_error
             + direction + len(error_list)) % len(error_list)
-        MinionNextErrorCommand.prev_error = current_error
+        errors.prev_error = current_error
 
         error = error_list[current_error]
 
-        working_dir = os.path.realpath(MinionNextErrorCommand.working_dir)
+        working_dir = os.path.realpath(errors.working_dir)
         if not os.path.isabs(error.file):
             error_file = os.path.realpath(os.path.join(working_dir, error.file))
         else:
@@ -232,205 +746,79 @@ class MinionNextErrorCommand(sublime_plugin.WindowCommand):
         self._highlight(error.source)
 
     @classmethod
-    def _show_phantoms(klass):
-        stylesheet = '''
-            <style>
-                div.error {
-                    padding: 0.4rem 0 0.4rem 0.7rem;
-                    margin: 0.2rem 0;
-                    border-radius: 2px;
-                }
-
-                div.error span.message {
-                    padding-right: 0.7rem;
-                }
-
-                div.error a {
-                    text-decoration: inherit;
-                    padding: 0.35rem 0.7rem 0.45rem 0.8rem;
-                    position: relative;
-                    bottom: 0.05rem;
-                    border-radius: 0 2px 2px 0;
-                    font-weight: bold;
-                }
-                html.dark div.error a {
-                    background-color: #00000018;
-                }
-                html.light div.error a {
-                    background-color: #ffffff18;
-                }
-            </style>
-        '''
-
-        error_list = klass.error_list
-        errors_by_file = {}
-
-        for error in error_list:
-            if error.file in errors_by_file:
-                errors_by_file[error.file].append(error)
-            else:
-                errors_by_file[error.file] = [error]
-
-        for file, errors in errors_by_file.items():
-            view = sublime.active_window().find_open_file(file)
-
-            if view:
-                buffer_id = view.buffer_id()
-
-                if buffer_id not in klass.phantom_sets:
-                    phantom_set = sublime.PhantomSet(view, "minion")
-                    klass.phantom_sets[buffer_id] = phantom_set
-                else:
-                    phantom_set = klass.phantom_sets[buffer_id]
-
-                phantoms = []
-
-                for _, line, column, _, text in errors:
-                    escaped = html.escape(text, quote=False).splitlines()[0].strip()
-
-                    pt = view.text_point(line - 1, max(0, column - 1 - len(escaped) // 2))
-                    phantoms.append(sublime.Phantom(
-                        sublime.Region(pt, view.line(pt).b),
-                        ('<body id=inline-error>' + stylesheet +
-                            '<div class="error">' +
-                            '<span class="message">' + escaped + '</span>' +
-                            '<a href=hide>' + chr(0x00D7) + '</a></div>' +
-                            '</body>'),
-                        sublime.LAYOUT_BELOW, on_navigate = klass.hide_phantoms))
-
-                phantom_set.update(phantoms)
+    def _show_phantoms(klass, window):
+        errors = klass.errors(window)
+        errors_by_file = errors.error_list.by_file(ErrorPhantoms.MAX_PER_FILE)
+        errors.phantoms.update(window, errors_by_file)
 
     @classmethod
-    def hide_phantoms(klass, url = None):
-        for view in sublime.active_window().views():
-            view.erase_phantoms("minion")
-
-        klass.phantom_sets = {}
+    def hide_phantoms(klass, url = None, window = None):
+        klass.errors(window).phantoms.clear()
 
     @classmethod
-    def _make_default_error_list(klass, buffer):
-        def split_error(line):
-            if line.startswith("In file included from "):
-                return None
-
-            if line.startswith("                 from "):
-                return None
-
-            split = line.split(":")
-
-            if 2 < len(split) and split[1].isdigit():
-                if 3 < len(split) and split[2].isdigit():
-                    return (split[0], split[1], split[2], line[sum(map(len, split[0:3])) + 3:])
-                return (split[0], split[1], 0, line[sum(map(len, split[0:2])) + 2:])
-
-            return None
-
-        def tilde_and_dash(line):
-            line = line.strip()
-            return line.count("~") + line.count("^") == len(line)
-
-        def hint(underscore, tentative):
-            begin = len(underscore) - len(underscore.lstrip())
-            tentative_begin = len(tentative) - len(tentative.lstrip())
-
-            return (begin < tentative_begin
-                and len("".join(tentative.split())) < len(underscore) // 2)
-
-        result = []
-
-        lines = list(buffer.splitlines(True))
-        itr, size = 0, len(lines)
-        offset = 0
-
-        while itr < size:
-            split = split_error(lines[itr])
-
-            if split:
-                message = lines[itr]
-
-                if itr + 2 < size and tilde_and_dash(lines[itr + 2]):
-                    if itr + 3 < size and hint(lines[itr + 2], lines[itr + 3]):
-                        message = "".join(lines[itr:itr + 4])
-                        itr += 4
-                    else:
-                        message = "".join(lines[itr:itr + 3])
-                        itr += 3
-                else:
-                    itr += 1
-
-                working_dir = os.path.realpath(klass.working_dir)
-                path = os.path.realpath(os.path.join(working_dir, split[0]))
-
-                result.append(
-                    ErrorListItem(
-                        path,
-                        int(split[1]),
-                        int(split[2]),
-                        (offset, offset + len(message)), message))
-
-                offset += len(message)
-            else:
-                offset += len(lines[itr])
-                itr += 1
-
-        return result
+    def make_error_list(klass, buffer, regex, working_dir = ""):
+        parser = ErrorParser(working_dir, regex)
+        parser.feed(buffer)
+        parser.finish()
+        return parser.items
 
     @classmethod
-    def _make_regex_error_list(klass, buffer, regex):
-        result = []
-        compiled = re.compile(regex)
-        offset = 0
-
-        for line in buffer.splitlines(True):
-            match = compiled.match(line)
-
-            if match:
-                match = match.groups()
-                result.append(ErrorListItem(
-                    match[0] if len(match) > 0 else "",
-                    int(match[1]) if len(match) > 1 and match[1] else 0,
-                    int(match[2]) if len(match) > 2 and match[2] else 0,
-                    (offset, offset + len(line)),
-                    match[3] if len(match) > 3 else line.strip()))
-
-            offset += len(line)
+    def _set_list_list(klass, error_list, window):
+        if not isinstance(error_list, ErrorList):
+            items = ErrorList()
 
-        return result
+            for item in error_list:
+                items.append(*item)
 
-    @classmethod
-    def make_error_list(klass, buffer, regex):
-        if regex == None:
-            return klass._make_default_error_list(buffer)
-        else:
-            return klass._make_regex_error_list(buffer, regex)
+            error_list = items
 
-    @classmethod
-    def _set_list_list(klass, error_list):
-        klass.error_list = error_list
-        klass.prev_error = -1
+        errors = klass.errors(window)
+        errors.error_list = error_list
+        errors.prev_error = -1
 
     @classmethod
-    def _set_list_str(klass, error_list, regex):
-        klass._set_list_list(klass.make_error_list(error_list, regex))
+    def _set_list_str(klass, error_list, regex, window):
+        working_dir = klass.errors(window).working_dir
+        klass._set_list_list(klass.make_error_list(error_list, regex, working_dir), window)
 
     @classmethod
-    def set_list(klass, error_list, working_dir, regex = None, show_phantoms = True):
-        klass.working_dir = working_dir
+    def set_list(klass, error_list, working_dir, regex = None, show_phantoms = True, window = None):
+        window = window if window != None else sublime.active_window()
+        klass.errors(window).working_dir = working_dir
 
         if isinstance(error_list, list):
-            klass._set_list_list(error_list)
+            klass._set_list_list(error_list, window)
         else:
-            klass._set_list_str(error_list, regex)
+            klass._set_list_str(error_list, regex, window)
 
         if show_phantoms:
-            klass._show_phantoms()
+            klass._show_phantoms(window)
 
     @classmethod
-    def reset_list(klass):
-        klass.error_list = []
-        klass.prev_error = -1
-        klass.working_dir = ""
-        klass.hide_phantoms()
+    def reset_list(klass, window = None):
+        errors = klass.errors(window)
+        errors.error_list = []
+        errors.prev_error = -1
+        errors.working_dir = ""
+        errors.parser = None
+        errors.phantoms.clear()
 
+    @classmethod
+    def stream_list(klass, parser, window = None):
+        klass.reset_list(window)
 
+        errors = klass.errors(window)
+        errors.working_dir = parser.working_dir
+        errors.parser = parser
+        errors.error_list = parser.items
 
+    @classmethod
+    def finish_list(klass, show_phantoms = True, window = None):
+        window = window if window != None else sublime.active_window()
+        errors = klass.errors(window)
+
+        if errors.parser:
+            errors.parser.finish()
+
+        if show_phantoms:
+            klass._show_phantoms(window)
@@ -48,12 +48,7 @@ class MinionBuildLatexCommand(sublime_plugin.WindowCommand):
         return expand_variables_ex(latex_data)
 
     def filter_single_line(self, panel, line, config, context):
-        ignore = False
-
-        for item in MinionBuildLatexCommand.ignore:
-            if re.match(item, line) != None:
-                ignore = True
-                break
+        ignore = IgnoreFilter.get(MinionBuildLatexCommand.ignore).match(line) != None
 
         if line.startswith("(./{}".format(config["main"])):
             ignore = True
@@ -111,8 +106,8 @@ class MinionBuildLatexCommand(sublime_plugin.WindowCommand):
         bibtex_data["working_dir"] = latex_data["working_dir"]
 
         print("Here!", flush = True)
-        MinionGenericBuildCommand.run_build(bibtex_data)
-        MinionGenericBuildCommand.run_build(latex_data, self.filter, self.on_finished)
+        MinionGenericBuildCommand.run_build(bibtex_data, window = self.window)
+        MinionGenericBuildCommand.run_build(latex_data, self.filter, self.on_finished, window = self.window)
 
 
 
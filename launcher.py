@@ -0,0 +1,438 @@
+import sublime
+import collections
+import json
+import os
+import re
+import select
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import threading
+
+if os.name != "nt":
+    import fcntl
+
+# plugin_loaded and plugin_unloaded stay out of star imports, modules
+# importing this one would otherwise close the spawn helper on reload.
+__all__ = ["launch", "Environment"]
+
+class Environment:
+    """
+    Process environments for build configurations. Variables of the
+    configuration are expanded against the plugin host environment, which
+    itself is never modified, and merged over a fresh copy of it on every
+    launch.
+    """
+
+    if os.name == "nt":
+        VARIABLE = re.compile(r"\$(\w+)|\$\{([^}]*)\}|%([^%]+)%")
+    else:
+        VARIABLE = re.compile(r"\$(\w+)|\$\{([^}]*)\}")
+
+    @staticmethod
+    def name(match):
+        return match.group(1) or match.group(2) or match.group(match.lastindex)
+
+    @staticmethod
+    def expand(value, variables):
+        def replace(match):
+            return variables.get(Environment.name(match), match.group(0))
+
+        return Environment.VARIABLE.sub(replace, value) if "$" in value or "%" in value else value
+
+    @staticmethod
+    def resolve(env = None, path = None):
+        """Returns the environment for a process with `env` variables and `path` as PATH."""
+        resolved = os.environ.copy()
+        variables = os.environ
+
+        if path:
+            # The build system decides whether $PATH is appended or
+            # tucked in front: "$PATH;C:\\new\\path", "C:\\new\\path;$PATH"
+            resolved["PATH"] = Environment.expand(path, os.environ)
+            variables = dict(os.environ, PATH = resolved["PATH"])
+
+        for name, value in (env or {}).items():
+            resolved[name] = Environment.expand(value, variables)
+
+        return resolved
+
+class HelperProcess:
+    """Popen-like handle of a process started by the SpawnHelper."""
+
+    def __init__(self, helper, pid, stdin, stdout, stderr):
+        self.helper = helper
+        self.pid = pid
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode == None:
+            self.returncode = self.helper.status(self.pid)
+
+        return self.returncode
+
+    def wait(self, timeout = None):
+        if self.returncode == None:
+            self.returncode = self.helper.wait(self.pid, timeout)
+
+            if self.returncode == None:
+                raise subprocess.TimeoutExpired(self.pid, timeout)
+
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.poll() == None:
+            os.kill(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+class SpawnHelper:
+    """
+    Small process forked from the plugin host before it grows, which
+    forks and execs builds on its behalf. Pipe ends are passed over a unix
+    socket, exit statuses are reported back as the children are reaped.
+    """
+
+    HEADER = struct.Struct("!I")
+    REAP_INTERVAL = 0.05
+    REPLY_TIMEOUT = 5.0
+
+    instance = None
+    instance_lock = threading.Lock()
+
+    @classmethod
+    def get(klass):
+        with klass.instance_lock:
+            if klass.instance == None or not klass.instance.alive:
+                klass.instance = SpawnHelper()
+
+            return klass.instance
+
+    @classmethod
+    def enabled(klass):
+        settings = sublime.load_settings("Preferences.sublime-settings")
+        return os.name != "nt" and hasattr(socket, "CMSG_LEN") and settings.get("minion_spawn_helper", False)
+
+    def __init__(self):
+        self.alive = True
+        self.lock = threading.Lock()
+        self.request_lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.replies = collections.deque()
+        self.statuses = {}
+
+        self.socket, remote = socket.socketpair()
+
+        for file in (self.socket, remote):
+            SpawnHelper.set_cloexec(file.fileno())
+
+        self.pid = os.fork()
+
+        if self.pid == 0:
+            code = 0
+
+            try:
+                self.socket.close()
+                SpawnHelper.serve(remote)
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+
+        remote.close()
+
+        self.thread = threading.Thread(target = self.receive_replies, daemon = True)
+        self.thread.start()
+
+    @staticmethod
+    def set_cloexec(fd):
+        fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+
+    @staticmethod
+    def send(sock, message, fds = ()):
+        payload = json.dumps(message).encode("utf-8")
+        data = SpawnHelper.HEADER.pack(len(payload)) + payload
+        ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, struct.pack("%di" % len(fds), *fds))] if fds else []
+        sent = sock.sendmsg([data], ancillary)
+
+        if sent < len(data):
+            sock.sendall(data[sent:])
+
+    @staticmethod
+    def receive(sock):
+        """Returns the next (message, fds), or (None, []) once the peer is gone."""
+        size = SpawnHelper.HEADER.size
+        header, ancillary, flags, address = sock.recvmsg(size, socket.CMSG_LEN(3 * struct.calcsize("i")))
+        fds = []
+
+        for level, kind, data in ancillary:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                data = data[:len(data) - len(data) % struct.calcsize("i")]
+                fds.extend(struct.unpack("%di" % (len(data) // struct.calcsize("i")), data))
+
+        while header and len(header) < size:
+            chunk = sock.recv(size - len(header))
+
+            if not chunk:
+                break
+
+            header += chunk
+
+        if len(header) < size:
+            return None, fds
+
+        length = SpawnHelper.HEADER.unpack(header)[0]
+        payload = b""
+
+        while len(payload) < length:
+            chunk = sock.recv(length - len(payload))
+
+            if not chunk:
+                return None, fds
+
+            payload += chunk
+
+        return json.loads(payload.decode("utf-8")), fds
+
+    @staticmethod
+    def serve(sock):
+        # Runs in the forked helper, only the calling thread survived the
+        # fork, so nothing here may wait for locks of the plugin host.
+        children = set()
+
+        while True:
+            timeout = SpawnHelper.REAP_INTERVAL if children else None
+            readable = select.select([sock], [], [], timeout)[0]
+
+            for pid in list(children):
+                done, status = os.waitpid(pid, os.WNOHANG)
+
+                if done:
+                    children.discard(pid)
+                    code = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+                    SpawnHelper.send(sock, { "exited" : pid, "status" : code })
+
+            if not readable:
+                continue
+
+            request, fds = SpawnHelper.receive(sock)
+
+            if request == None:
+                return
+
+            reply = SpawnHelper.spawn(request, fds)
+
+            for fd in fds:
+                os.close(fd)
+
+            if "pid" in reply:
+                children.add(reply["pid"])
+
+            SpawnHelper.send(sock, reply)
+
+    @staticmethod
+    def spawn(request, fds):
+        if len(fds) != 3:
+            return { "errno" : 0, "error" : "expected 3 descriptors, got {}".format(len(fds)) }
+
+        for fd in fds:
+            SpawnHelper.set_cloexec(fd)
+
+        # Reports exec failures, closed on a successful exec.
+        error_read, error_write = os.pipe()
+        SpawnHelper.set_cloexec(error_write)
+
+        pid = os.fork()
+
+        if pid == 0:
+            try:
+                os.close(error_read)
+
+                if request["new_session"]:
+                    os.setsid()
+
+                for target, fd in enumerate(fds):
+                    os.dup2(fd, target)
+
+                if request["cwd"]:
+                    os.chdir(request["cwd"])
+
+                args = request["args"]
+                os.execvpe(args[0], args, request["env"])
+            except OSError as error:
+                os.write(error_write, json.dumps([error.errno, error.strerror]).encode("utf-8"))
+            finally:
+                os._exit(127)
+
+        os.close(error_write)
+        data = b""
+
+        while True:
+            chunk = os.read(error_read, 4096)
+
+            if not chunk:
+                break
+
+            data += chunk
+
+        os.close(error_read)
+
+        if data:
+            os.waitpid(pid, 0)
+            number, message = json.loads(data.decode("utf-8"))
+            return { "errno" : number, "error" : message, "file" : request["args"][0] }
+
+        return { "pid" : pid }
+
+    def receive_replies(self):
+        while True:
+            try:
+                message, fds = SpawnHelper.receive(self.socket)
+            except OSError:
+                message = None
+
+            with self.lock:
+                if message == None:
+                    self.alive = False
+                    self.replies.append(None)
+                    self.condition.notify_all()
+                    return
+
+                if "exited" in message:
+                    self.statuses[message["exited"]] = message["status"]
+                else:
+                    self.replies.append(message)
+
+                self.condition.notify_all()
+
+    def status(self, pid):
+        with self.lock:
+            if pid in self.statuses:
+                return self.statuses.pop(pid)
+
+            # Exit statuses are lost with the helper.
+            return None if self.alive else -1
+
+    def wait(self, pid, timeout = None):
+        with self.lock:
+            self.condition.wait_for(lambda: pid in self.statuses or not self.alive, timeout)
+
+        return self.status(pid)
+
+    def launch(self, args, cwd, env, merge_stderr, new_session, stdin = subprocess.DEVNULL):
+        # Only a PIPE stdin is given a pipe, anything else reads /dev/null.
+        if stdin == subprocess.PIPE:
+            stdin_read, stdin_write = os.pipe()
+        else:
+            stdin_read, stdin_write = os.open(os.devnull, os.O_RDONLY), None
+
+        stdout_read, stdout_write = os.pipe()
+        stderr_read, stderr_write = os.pipe() if not merge_stderr else (None, stdout_write)
+
+        for fd in (stdin_write, stdout_read, stderr_read):
+            if fd != None:
+                SpawnHelper.set_cloexec(fd)
+
+        try:
+            with self.request_lock:
+                SpawnHelper.send(self.socket, {
+                    "args" : args,
+                    "cwd" : cwd,
+                    "env" : env,
+                    "new_session" : new_session }, [stdin_read, stdout_write, stderr_write])
+
+                with self.lock:
+                    if not self.condition.wait_for(lambda: self.replies, SpawnHelper.REPLY_TIMEOUT):
+                        # A late reply would be taken for the next request.
+                        self.alive = False
+                        raise OSError("Spawn helper is not responding.")
+
+                    reply = self.replies.popleft()
+        except BaseException:
+            for fd in (stdin_write, stdout_read, stderr_read):
+                if fd != None:
+                    os.close(fd)
+
+            raise
+        finally:
+            for fd in set((stdin_read, stdout_write, stderr_write)):
+                os.close(fd)
+
+        if reply == None:
+            raise OSError("Spawn helper exited.")
+
+        if "error" in reply:
+            for fd in (stdin_write, stdout_read, stderr_read):
+                if fd != None:
+                    os.close(fd)
+
+            raise OSError(reply["errno"], reply["error"], reply.get("file"))
+
+        return HelperProcess(
+            self,
+            reply["pid"],
+            open(stdin_write, "wb") if stdin_write != None else None,
+            open(stdout_read, "rb"),
+            open(stderr_read, "rb") if stderr_read != None else None)
+
+    def close(self):
+        self.socket.close()
+
+def launch(args, cwd = None, env = None, path = None, shell = False, merge_stderr = False, new_session = False, startupinfo = None, stdin = subprocess.DEVNULL):
+    """
+    Starts a process with stdout and stderr pipes, without touching the
+    environment or working directory of the plugin host. Its stdin is
+    /dev/null unless `stdin` is subprocess.PIPE, nothing would feed a
+    tool waiting for input. With the "minion_spawn_helper" setting the
+    process is started by the SpawnHelper.
+    """
+    environment = Environment.resolve(env, path)
+
+    if shell and os.name != "nt":
+        args = ["/bin/sh", "-c"] + ([args] if isinstance(args, str) else list(args))
+        shell = False
+
+    if os.name == "nt" and path and not shell and not isinstance(args, str):
+        # CreateProcess looks up executables with the PATH of the caller.
+        executable = shutil.which(args[0], path = environment.get("PATH"))
+        args = [executable or args[0]] + list(args[1:])
+
+    if SpawnHelper.enabled() and not isinstance(args, str):
+        try:
+            return SpawnHelper.get().launch(list(args), cwd, environment, merge_stderr, new_session, stdin)
+        except (OSError, ValueError) as error:
+            if getattr(error, "errno", None) not in (None, 0):
+                raise
+
+            print("Spawn helper failed, starting the process directly: {}".format(error))
+
+    return subprocess.Popen(
+        args,
+        stdin = stdin,
+        stdout = subprocess.PIPE,
+        stderr = subprocess.STDOUT if merge_stderr else subprocess.PIPE,
+        cwd = cwd or None,
+        env = environment,
+        shell = shell,
+        startupinfo = startupinfo,
+        start_new_session = new_session)
+
+def plugin_loaded():
+    # Fork while the plugin host is still small.
+    if SpawnHelper.enabled():
+        SpawnHelper.get()
+
+def plugin_unloaded():
+    with SpawnHelper.instance_lock:
+        if SpawnHelper.instance != None:
+            SpawnHelper.instance.close()
+            SpawnHelper.instance = None
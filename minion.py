@@ -97,9 +97,6 @@ class MinionBuildCommand(sublime_plugin.WindowCommand):
             self.build_latex_project()
         elif self.is_project_opened():
             window = self.window
-
-            OutputView.request().clear()
-
             build_systems = self.build_systems()
 
             if self.build_system in build_systems:
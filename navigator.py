@@ -1,38 +1,129 @@
 import hashlib
+import json
 import sublime
 import sublime_plugin
 import ctypes
 import _ctypes
+import collections
+import itertools
 import os.path
 import os
+import re
+import select
+import signal
+import socket
+import struct
+import sys
 import tempfile
 import shutil
+import threading
 import time
+import traceback
 
 navigator_dl = None
 temporary_dir = os.path.join(tempfile.gettempdir(), "navigator-2vdsy32egx")
-navigator_object = None
+navigator_new = None
+navigator_delete = None
 navigator_code_complete_at = None
 navigator_unsaved_file_t = None
+navigator_free_result = None
+navigator_lock = threading.Lock()
+navigator_failed = None
+
+DEFAULT_NAVIGATOR_PATH = "/home/wojciech/Desktop/haste-os.path/build/lib/libnavigator.so"
 
 def compute_hash(filename):
   sha256_hash = hashlib.sha256()
   with open(filename,"rb") as file:
-      for block in iter(lambda: file.read(4096), b""):
+      for block in iter(lambda: file.read(2**20), b""):
           sha256_hash.update(block)
 
       return sha256_hash.hexdigest()
 
+def library_hash(filename):
+  """compute_hash() of `filename`, remembered by its path, size and mtime."""
+  stat = os.stat(filename)
+  key = [stat.st_size, stat.st_mtime]
+  hashes_file = os.path.join(temporary_dir, "hashes.json")
 
-def plugin_loaded():
+  try:
+    with open(hashes_file) as file:
+      hashes = json.load(file)
+  except (OSError, ValueError):
+    hashes = {}
+
+  if filename in hashes and hashes[filename][:2] == key:
+    return hashes[filename][2]
+
+  hash = compute_hash(filename)
+  hashes[filename] = key + [hash]
+
+  try:
+    os.makedirs(temporary_dir, exist_ok = True)
+
+    with open(hashes_file, "w") as file:
+      json.dump(hashes, file)
+  except OSError as error:
+    print("Unable to cache the hash of {}: {}".format(filename, error))
+
+  return hash
+
+def navigator_path():
+  settings = sublime.load_settings("Preferences.sublime-settings")
+  return settings.get("minion_navigator_path", DEFAULT_NAVIGATOR_PATH)
+
+def free_results_enabled():
+  settings = sublime.load_settings("Preferences.sublime-settings")
+  return settings.get("minion_navigator_free_result", False)
+
+def is_cpp(view):
+  return "source.c++" in view.scope_name(0)
+
+def project_root(view):
+  """The innermost folder of the window containing the file of `view`, else its directory."""
+  filename = view.file_name() or ""
+  window = view.window()
+  folders = window.folders() if window != None else []
+  containing = [folder for folder in folders if filename.startswith(os.path.join(folder, ""))]
+
+  return max(containing, key = len) if containing else os.path.dirname(filename)
+
+def load_navigator():
+  """
+  Loads libnavigator on first use, returns whether it is available. A
+  library that failed to load is not tried again until the path setting
+  changes.
+  """
+  global navigator_failed
+
+  with navigator_lock:
+    if navigator_dl != None:
+      return True
+
+    path = navigator_path()
+
+    if navigator_failed == path:
+      return False
+
+    try:
+      load_library(path, free_results_enabled())
+    except (OSError, AttributeError) as error:
+      print("Unable to load {}: {}".format(path, error))
+      navigator_failed = path
+      return False
+
+    return True
+
+def load_library(navigator_filename, free_results = False):
   global navigator_dl
   global temporary_dir
-  global navigator_object
+  global navigator_new
+  global navigator_delete
   global navigator_code_complete_at
   global navigator_unsaved_file_t
+  global navigator_free_result
 
-  navigator_filename = "/home/wojciech/Desktop/haste-os.path/build/lib/libnavigator.so"
-  hash = compute_hash(navigator_filename)
+  hash = library_hash(navigator_filename)
   libnavigator_so = os.path.join(temporary_dir, hash + ".so")
 
   if not os.path.exists(libnavigator_so):
@@ -40,7 +131,7 @@ def plugin_loaded():
     shutil.copy(navigator_filename, libnavigator_so)
 
   print(libnavigator_so)
-  navigator_dl = ctypes.CDLL(libnavigator_so)
+  dl = ctypes.CDLL(libnavigator_so)
 
   class RESULT(ctypes.Structure):
     _fields_ = [("ptr", ctypes.POINTER(ctypes.c_char_p)),
@@ -53,14 +144,15 @@ def plugin_loaded():
 
   navigator_unsaved_file_t = UNSAVED_FILE_T
 
-  haste_new_navigator = navigator_dl.haste_new_navigator
-  haste_new_navigator.restype = ctypes.c_void_p
+  navigator_new = dl.haste_new_navigator
+  navigator_new.argtypes = []
+  navigator_new.restype = ctypes.c_void_p
 
-  navigator_object = navigator_dl.haste_new_navigator()
+  navigator_delete = dl.haste_del_navigator
+  navigator_delete.argtypes = [ctypes.c_void_p]
+  navigator_delete.restype = None
 
-  print("Create navigator_object: ", navigator_object)
-
-  navigator_code_complete_at = navigator_dl.haste_navigator_code_complete_at
+  navigator_code_complete_at = dl.haste_navigator_code_complete_at
   navigator_code_complete_at.argtypes = [
     ctypes.c_void_p,
     ctypes.c_char_p,
@@ -71,85 +163,1011 @@ def plugin_loaded():
 
   navigator_code_complete_at.restype = RESULT
 
-  if navigator_object == None:
-    print("Unable to create navigator_object.")
+  # Assumed to be void haste_free_result(RESULT), taking the result by
+  # value as haste_navigator_code_complete_at returns it. No libnavigator
+  # header at hand confirms that, a build taking a pointer would corrupt
+  # memory on every completion. Until then it is only called with the
+  # "minion_navigator_free_result" setting, without it results leak.
+  navigator_free_result = getattr(dl, "haste_free_result", None) if free_results else None
+
+  if navigator_free_result != None:
+    navigator_free_result.argtypes = [RESULT]
+    navigator_free_result.restype = None
+  elif free_results:
+    print("libnavigator has no haste_free_result, completion results are not released.")
+
+  # Set last, load_navigator() takes it for a complete load.
+  navigator_dl = dl
+
+def plugin_loaded():
+  # Loading waits for the first C++ view, unless one is already active.
+  window = sublime.active_window()
+  view = window.active_view() if window != None else None
+
+  if view != None and is_cpp(view):
+    sublime.set_timeout_async(warm_up, 0)
+
+def warm_up():
+  # The "minion_navigator_process" setting moves the library out of the
+  # plugin host.
+  if NavigatorProcess.enabled():
+    NavigatorProcess.get()
+  else:
+    load_navigator()
 
 def plugin_unloaded():
-  global navigator_dl
-  global navigator_object
-  navigator_dl.haste_del_navigator(navigator_object)
-  navigator_object = None
+  NavigatorProcess.shutdown()
 
-def code_complete_at(filename, line, column, unsaved):
-  global navigator_object
-  global navigator_code_complete_at
-  global navigator_unsaved_file_t
+  with navigator_lock:
+    NavigatorPool.clear()
 
-  start = time.time()
+class NavigatorPool:
+  """
+  A navigator per project root, so that projects don't evict each other's
+  translation units. Beyond "minion_navigator_pool_size" navigators, the
+  least recently used one is deleted.
+  """
+
+  navigators = collections.OrderedDict()
+  lock = threading.Lock()
 
-  native_unsaved_files = (navigator_unsaved_file_t * len(unsaved))()
+  @staticmethod
+  def size():
+    settings = sublime.load_settings("Preferences.sublime-settings")
+    return max(1, settings.get("minion_navigator_pool_size", 4))
 
-  for i in range(len(unsaved)):
-    content = unsaved[0][1].encode(encoding = 'UTF-8')
-    native_unsaved_files[i].filename = unsaved[0][0].encode(encoding = 'UTF-8')
-    native_unsaved_files[i].content = content
-    native_unsaved_files[i].length = len(content)
+  @classmethod
+  def acquire(klass, root, size):
+    """The navigator of `root`, created if needed. None if libnavigator couldn't."""
+    with klass.lock:
+      navigator = klass.navigators.get(root)
 
-  native_start = time.time()
+      if navigator != None:
+        klass.navigators.move_to_end(root)
+        return navigator
+
+      navigator = navigator_new()
+
+      if not navigator:
+        print("Unable to create a navigator for {}.".format(root))
+        return None
+
+      print("Created a navigator for {}.".format(root))
+      klass.navigators[root] = navigator
+
+      while len(klass.navigators) > size:
+        evicted, navigator = klass.navigators.popitem(last = False)
+        navigator_delete(navigator)
+        print("Deleted the navigator of {}.".format(evicted))
+
+      return klass.navigators[root]
+
+  @classmethod
+  def clear(klass):
+    with klass.lock:
+      while klass.navigators:
+        navigator_delete(klass.navigators.popitem()[1])
+
+def code_complete_at(navigator, filename, line, column, unsaved):
+  global navigator_code_complete_at
+  global navigator_unsaved_file_t
+
+  start = time.time()
 
   native_result = navigator_code_complete_at(
-    navigator_object,
+    navigator,
     filename.encode(encoding = 'UTF-8'),
     line,
     column,
-    native_unsaved_files,
-    len(native_unsaved_files))
+    unsaved,
+    len(unsaved))
 
   print("Completions native call took ", time.time() - start, " seconds.")
 
-  index = 0
-  result = []
-
-  for i in range(native_result.len // 2):
-    completion = (
-      native_result.ptr[i * 2 + 0].decode(encoding = 'UTF-8'),
-      native_result.ptr[i * 2 + 1].decode(encoding = 'UTF-8'))
-
-    result.append(completion)
+  try:
+    result = decode_result(native_result)
+  finally:
+    free_result(native_result)
 
   print("Completions retrieved in ", time.time() - start, " seconds.")
 
   return result
 
-class CodeCompleteCommand(sublime_plugin.ViewEventListener):
-  last_completion = None
+def result_blob(native_result):
+  """The strings of the complete pairs of a native result joined by NUL, and their count."""
+  count = native_result.len - native_result.len % 2
+
+  if count == 0:
+    return 0, b""
+
+  # Slicing copies all the strings out in one go.
+  return count, b"\0".join([string or b"" for string in native_result.ptr[:count]])
+
+def decode_blob(count, blob):
+  """(display, insertion) pairs of a result_blob(), decoded with a single call."""
+  if count == 0:
+    return []
+
+  strings = blob.decode(encoding = 'UTF-8', errors = 'replace').split("\0")
+  return list(zip(strings[0::2], strings[1::2]))
+
+def decode_result(native_result):
+  """Decodes the (display, insertion) pairs of a native result in one pass."""
+  return decode_blob(*result_blob(native_result))
+
+def free_result(native_result):
+  """Releases a result returned by libnavigator, with the "minion_navigator_free_result" setting."""
+  if navigator_free_result != None:
+    navigator_free_result(native_result)
+
+# Frames exchanged with the navigator process: a kind and a payload size,
+# then the payload. A completion carries the request id, position, project
+# root, file name and the unsaved buffers, each with its name and content
+# size, or UNCHANGED if the worker still holds the buffer of the last
+# request.
+FRAME_HEADER = struct.Struct("!BI")
+REQUEST_HEADER = struct.Struct("!IQQIII")
+FILE_HEADER = struct.Struct("!IQ")
+RESULT_HEADER = struct.Struct("!II")
+ID_HEADER = struct.Struct("!I")
+
+FRAME_COMPLETE = 1
+FRAME_CANCEL = 2
+FRAME_RESULT = 3
+FRAME_ERROR = 4
+
+UNCHANGED = 2**64 - 1
+
+def send_frame(sock, kind, parts):
+  """Writes a frame made of `parts` without joining them first."""
+  buffers = [memoryview(part) for part in parts if len(part) > 0]
+  buffers.insert(0, memoryview(FRAME_HEADER.pack(kind, sum(len(buffer) for buffer in buffers))))
+
+  while buffers:
+    sent = sock.sendmsg(buffers[:256])
+
+    while buffers and sent >= len(buffers[0]):
+      sent -= len(buffers[0])
+      buffers.pop(0)
+
+    if sent > 0:
+      buffers[0] = buffers[0][sent:]
+
+def receive_exactly(sock, size):
+  data = bytearray(size)
+  view = memoryview(data)
+  received = 0
+
+  while received < size:
+    count = sock.recv_into(view[received:])
+
+    if count == 0:
+      return None
+
+    received += count
+
+  return data
+
+def receive_frame(sock):
+  """Returns the next (kind, payload), or None once the peer is gone."""
+  header = receive_exactly(sock, FRAME_HEADER.size)
+
+  if header == None:
+    return None
+
+  kind, size = FRAME_HEADER.unpack(header)
+  payload = receive_exactly(sock, size)
+
+  return (kind, payload) if payload != None else None
+
+def read_request(payload, files):
+  """
+  Parses a completion frame, `files` is updated with the buffers it
+  carries. Their content is left in the frame, which `files` keeps alive.
+  """
+  id, line, column, root_length, name_length, count = REQUEST_HEADER.unpack_from(payload)
+  offset = REQUEST_HEADER.size
+  root = payload[offset:offset + root_length].decode("utf-8")
+  offset += root_length
+  filename = bytes(payload[offset:offset + name_length])
+  offset += name_length
+  names = []
+
+  for _ in range(count):
+    name_length, length = FILE_HEADER.unpack_from(payload, offset)
+    offset += FILE_HEADER.size
+    name = bytes(payload[offset:offset + name_length])
+    offset += name_length
+
+    if length != UNCHANGED:
+      files[name] = (payload, offset, length)
+      offset += length
+
+    names.append(name)
+
+  for name in list(files):
+    if name not in names:
+      del files[name]
+
+  return id, root, filename, line, column, [name for name in names if name in files]
+
+def native_unsaved(files, names):
+  unsaved = (navigator_unsaved_file_t * len(names))()
+
+  for i, name in enumerate(names):
+    frame, offset, length = files[name]
+    unsaved[i].filename = name
+    unsaved[i].content = ctypes.addressof(ctypes.c_char.from_buffer(frame, offset)) if length > 0 else b""
+    unsaved[i].length = length
+
+  return unsaved
+
+def serve_navigator(sock, path, pool_size, free_results):
+  """
+  Runs in the forked navigator process, answers completion frames in
+  order until the plugin host goes away. Requests cancelled while they
+  were queued are answered without the native call.
+  """
+  # Navigators of the plugin host are not ours, nor is its lock.
+  NavigatorPool.navigators = collections.OrderedDict()
+  NavigatorPool.lock = threading.Lock()
+
+  try:
+    load_library(path, free_results)
+  except (OSError, AttributeError) as error:
+    send_frame(sock, FRAME_ERROR, [ID_HEADER.pack(0), "Unable to load {}: {}".format(path, error).encode("utf-8")])
+    return 1
+
+  files = {}
+  requests = collections.deque()
+  cancelled = set()
+
+  while True:
+    # Frames queued behind the current request are read first, they may
+    # cancel it.
+    while not requests or select.select([sock], [], [], 0)[0]:
+      frame = receive_frame(sock)
+
+      if frame == None:
+        return 0
+
+      kind, payload = frame
+
+      if kind == FRAME_CANCEL:
+        cancelled.add(ID_HEADER.unpack_from(payload)[0])
+      elif kind == FRAME_COMPLETE:
+        requests.append(read_request(payload, files))
+
+    id, root, filename, line, column, names = requests.popleft()
+
+    if id in cancelled:
+      cancelled = set(other for other in cancelled if other > id)
+      send_frame(sock, FRAME_ERROR, [ID_HEADER.pack(id), b"cancelled"])
+      continue
+
+    navigator = NavigatorPool.acquire(root, pool_size)
+
+    if navigator == None:
+      send_frame(sock, FRAME_ERROR, [ID_HEADER.pack(id), "Unable to create a navigator for {}.".format(root).encode("utf-8")])
+      continue
+
+    try:
+      unsaved = native_unsaved(files, names)
+      native_result = navigator_code_complete_at(navigator, filename, line, column, unsaved, len(unsaved))
+
+      try:
+        count, blob = result_blob(native_result)
+      finally:
+        free_result(native_result)
+    except Exception as error:
+      send_frame(sock, FRAME_ERROR, [ID_HEADER.pack(id), str(error).encode("utf-8")])
+      continue
+
+    send_frame(sock, FRAME_RESULT, [RESULT_HEADER.pack(id, count), blob])
+
+class UnsavedFiles:
+  """
+  Encoded content of the modified C/C++ views of a window, passed to
+  libnavigator with a completion. A view is read and encoded again only
+  once its change count moved, the native array is rebuilt only if any
+  of the files changed.
+  """
+
+  SCOPES = ("source.c++", "source.c ", "source.objc")
+
+  def __init__(self):
+    # View id -> (change count, file name, content), all encoded.
+    self.entries = {}
+    self.array = None
+
+  @staticmethod
+  def is_source(view):
+    scope = view.scope_name(0)
+    return any(name in scope for name in UnsavedFiles.SCOPES)
+
+  def collect(self, view):
+    """Returns the entries of the unsaved files for a completion in `view`, by view id."""
+    window = view.window()
+    others = [other for other in (window.views() if window != None else []) if other.id() != view.id()]
+    entries = {}
+
+    for other in [view] + others:
+      if other != view and not (other.is_dirty() and other.file_name() and self.is_source(other)):
+        continue
+
+      change_count = other.change_count()
+      entry = self.entries.get(other.id())
+
+      if entry == None or entry[0] != change_count:
+        entry = (
+          change_count,
+          other.file_name().encode(encoding = 'UTF-8'),
+          other.substr(sublime.Region(0, other.size())).encode(encoding = 'UTF-8'))
+
+      entries[other.id()] = entry
+
+    # Saved and closed views are dropped here.
+    self.entries = entries
+    return entries
+
+  def native(self):
+    """The native array of the collected files."""
+    entries = self.entries
+    key = [id(entry) for entry in entries.values()]
+
+    if self.array == None or self.array[0] != key:
+      native = (navigator_unsaved_file_t * len(entries))()
+
+      for i, (_, filename, content) in enumerate(entries.values()):
+        native[i].filename = filename
+        native[i].content = content
+        native[i].length = len(content)
+
+      # The entries are kept alive with the array, so their ids stay unique.
+      self.array = (key, native, list(entries.values()))
+
+    return self.array[1]
+
+class NavigatorCall:
+  def __init__(self):
+    self.event = threading.Event()
+    self.kind = None
+    self.payload = None
+
+  def finish(self, kind, payload):
+    self.kind = kind
+    self.payload = payload
+    self.event.set()
+
+class NavigatorProcess:
+  """
+  libnavigator hosted in a process forked from the plugin host, so that
+  a crash or a hung native call leaves the plugins alone. Requests are
+  answered in order, late replies to abandoned ones are dropped. A
+  worker that crashed or hung is started again on the next completion,
+  at most RESTART_LIMIT times per RESTART_WINDOW seconds. One that
+  couldn't load the library is not, until the path setting changes.
+  """
+
+  RESTART_LIMIT = 3
+  RESTART_WINDOW = 60.0
+  HANG_TIMEOUT = 30.0
+
+  instance = None
+  instance_lock = threading.Lock()
+  starts = collections.deque()
+  failed_path = None
+
+  @staticmethod
+  def enabled():
+    settings = sublime.load_settings("Preferences.sublime-settings")
+    return hasattr(os, "fork") and settings.get("minion_navigator_process", False)
+
+  @classmethod
+  def get(klass):
+    """The running worker, None while it keeps failing to start."""
+    with klass.instance_lock:
+      if klass.instance != None and klass.instance.alive:
+        return klass.instance
+
+      path = navigator_path()
+
+      if klass.failed_path == path:
+        return None
+
+      now = time.time()
+
+      while klass.starts and now - klass.starts[0] > klass.RESTART_WINDOW:
+        klass.starts.popleft()
+
+      if len(klass.starts) >= klass.RESTART_LIMIT:
+        return None
+
+      klass.starts.append(now)
+      klass.instance = NavigatorProcess(path, NavigatorPool.size(), free_results_enabled())
+      return klass.instance
+
+  @classmethod
+  def shutdown(klass):
+    with klass.instance_lock:
+      if klass.instance != None:
+        klass.instance.kill()
+        klass.instance = None
+
+  def __init__(self, path, pool_size, free_results):
+    self.path = path
+    self.alive = True
+    self.exited = False
+    self.lock = threading.Lock()
+    self.send_lock = threading.Lock()
+    self.ids = itertools.count(1)
+    self.calls = {}
+    self.outstanding = 0
+    self.last_reply = time.time()
+    # File name -> (view id, change count) of the buffers the worker holds.
+    self.sent = {}
+
+    self.socket, remote = socket.socketpair()
+    self.pid = os.fork()
+
+    if self.pid == 0:
+      code = 1
+
+      try:
+        self.socket.close()
+        # The console of the plugin host is out of reach from here.
+        sys.stdout = sys.stderr = open(os.devnull, "w")
+        code = serve_navigator(remote, path, pool_size, free_results)
+      except BaseException:
+        pass
+      finally:
+        os._exit(code)
+
+    remote.close()
+
+    self.thread = threading.Thread(target = self.receive_replies, daemon = True)
+    self.thread.start()
+
+  def receive_replies(self):
+    while True:
+      try:
+        frame = receive_frame(self.socket)
+      except OSError:
+        frame = None
+
+      if frame == None:
+        break
 
+      kind, payload = frame
+      id = ID_HEADER.unpack_from(payload)[0]
+
+      if id == 0:
+        # The library failed to load, the worker exits.
+        print("Navigator process: " + payload[ID_HEADER.size:].decode("utf-8", "replace"))
+        NavigatorProcess.failed_path = self.path
+        continue
+
+      with self.lock:
+        self.last_reply = time.time()
+        self.outstanding -= 1
+        call = self.calls.pop(id, None)
+
+      if call != None:
+        call.finish(kind, payload)
+
+    with self.lock:
+      self.alive = False
+      calls = list(self.calls.values())
+      self.calls.clear()
+
+    for call in calls:
+      call.finish(FRAME_ERROR, None)
+
+    self.socket.close()
+    os.waitpid(self.pid, 0)
+
+    with self.lock:
+      self.exited = True
+
+  def kill(self):
+    with self.lock:
+      self.alive = False
+
+      if not self.exited:
+        try:
+          os.kill(self.pid, signal.SIGKILL)
+        except OSError:
+          pass
+
+  def send(self, kind, parts):
+    try:
+      with self.send_lock:
+        send_frame(self.socket, kind, parts)
+
+      return True
+    except OSError:
+      self.kill()
+      return False
+
+  def request(self, id, root, filename, line, column, entries):
+    with self.send_lock:
+      root = root.encode(encoding = 'UTF-8')
+      name = filename.encode(encoding = 'UTF-8')
+      parts = [None, root, name]
+      sent = {}
+
+      for view_id, (change_count, file, content) in entries.items():
+        if file in sent:
+          continue
+
+        sent[file] = (view_id, change_count)
+        unchanged = self.sent.get(file) == sent[file]
+
+        parts.append(FILE_HEADER.pack(len(file), UNCHANGED if unchanged else len(content)))
+        parts.append(file)
+
+        if not unchanged:
+          parts.append(content)
+
+      parts[0] = REQUEST_HEADER.pack(id, line, column, len(root), len(name), len(sent))
+
+      try:
+        send_frame(self.socket, FRAME_COMPLETE, parts)
+      except OSError:
+        self.kill()
+        return False
+
+      self.sent = sent
+      return True
+
+  def complete(self, root, filename, line, column, entries, timeout):
+    """
+    Completions at `line`, `column` of `filename` by the navigator of
+    `root`, with the UnsavedFiles `entries`. None if the worker didn't
+    answer within `timeout` seconds.
+    """
+    call = NavigatorCall()
+
+    with self.lock:
+      if not self.alive:
+        return None
+
+      id = next(self.ids)
+      self.calls[id] = call
+
+      if self.outstanding == 0:
+        self.last_reply = time.time()
+
+      self.outstanding += 1
+
+    if not self.request(id, root, filename, line, column, entries):
+      return None
+
+    if not call.event.wait(timeout):
+      self.abandon(id)
+      return None
+
+    if call.kind == FRAME_RESULT:
+      count = RESULT_HEADER.unpack_from(call.payload)[1]
+      return decode_blob(count, call.payload[RESULT_HEADER.size:])
+
+    if call.payload == None:
+      if NavigatorProcess.failed_path != self.path:
+        print("Navigator process exited, it is started again with the next completion.")
+    else:
+      print("Navigator process: " + call.payload[ID_HEADER.size:].decode("utf-8", "replace"))
+
+    return None
+
+  def abandon(self, id):
+    with self.lock:
+      self.calls.pop(id, None)
+      hung = time.time() - self.last_reply > NavigatorProcess.HANG_TIMEOUT
+
+    if hung:
+      print("Navigator process is not responding, restarting it.")
+      self.kill()
+    else:
+      self.send(FRAME_CANCEL, [ID_HEADER.pack(id)])
+
+COMPLETION_FLAGS = sublime.INHIBIT_WORD_COMPLETIONS | sublime.INHIBIT_EXPLICIT_COMPLETIONS
+
+def completion_timeout():
+  settings = sublime.load_settings("Preferences.sublime-settings")
+  return settings.get("minion_completion_timeout", 2000)
+
+def filter_completions(completions, triggers, prefix):
+  """Candidates starting with `prefix` first, then those containing its letters in order."""
+  if not prefix:
+    return completions
+
+  prefix = prefix.lower()
+  fuzzy = re.compile(".*?".join(re.escape(char) for char in prefix))
+  prefixed = []
+  matched = []
+
+  for completion, trigger in zip(completions, triggers):
+    if trigger.startswith(prefix):
+      prefixed.append(completion)
+    elif fuzzy.match(trigger):
+      matched.append(completion)
+
+  return prefixed + matched
+
+class CompletionEntry:
+  """
+  Candidates for the token starting at `start`. They stay valid while
+  the edits since the native call are confined to that token.
+  """
+
+  CONTEXT = 64
+  TOKEN = re.compile(r"\w*\Z")
+
+  def __init__(self, view, start, location):
+    self.filename = view.file_name()
+    self.start = start
+    self.change_count = view.change_count()
+    self.tail = view.size() - location
+    self.context = view.substr(sublime.Region(max(0, start - self.CONTEXT), start))
+    self.completions = None
+    self.triggers = None
+
+  def key(self):
+    return (self.filename, self.start)
+
+  def valid(self, view, location):
+    if location < self.start or view.size() - location != self.tail:
+      return False
+
+    if view.substr(sublime.Region(max(0, self.start - self.CONTEXT), self.start)) != self.context:
+      return False
+
+    return self.TOKEN.match(view.substr(sublime.Region(self.start, location))) != None
+
+  def filter(self, view, location):
+    if self.triggers == None:
+      self.triggers = [completion[0].split("\t")[0].lower() for completion in self.completions]
+
+    prefix = view.substr(sublime.Region(self.start, location))
+    return filter_completions(self.completions, self.triggers, prefix)
+
+class CompletionCache:
+  """Least recently used completion entries by (file, token start)."""
+
+  SIZE = 16
+
+  entries = collections.OrderedDict()
+
+  @classmethod
+  def get(klass, view, start, location):
+    entry = klass.entries.get((view.file_name(), start))
+
+    if entry == None:
+      return None
+
+    if not entry.valid(view, location):
+      del klass.entries[entry.key()]
+      return None
+
+    klass.entries.move_to_end(entry.key())
+    return entry
+
+  @classmethod
+  def put(klass, entry):
+    klass.entries[entry.key()] = entry
+    klass.entries.move_to_end(entry.key())
+
+    while len(klass.entries) > klass.SIZE:
+      klass.entries.popitem(last = False)
+
+  @classmethod
+  def evict(klass, view):
+    """Drops the entries of `view` an edit outside of their token invalidated."""
+    selection = view.sel()
+    location = selection[0].b if len(selection) == 1 else -1
+
+    for key, entry in list(klass.entries.items()):
+      if key[0] == view.file_name() and (location == -1 or not entry.valid(view, location)):
+        del klass.entries[key]
+
+class CompletionRequest:
+  """
+  A completion for the token starting at `start`. It is answered at most
+  once, with nothing if the cursor left the token or it missed its deadline.
+  """
+
+  def __init__(self, view, start, location):
+    self.view = view
+    self.filename = view.file_name()
+    self.root = project_root(view)
+    self.start = start
+    self.row, self.col = view.rowcol(start)
+    self.entry = CompletionEntry(view, start, location)
+    self.completion_lists = []
+    self.done = False
+
+  def is_current(self):
+    if self.done or not self.view.is_valid():
+      return False
+
+    selection = self.view.sel()
+    return len(selection) == 1 and self.entry.valid(self.view, selection[0].b)
+
+  def cancel(self):
+    # Runs on the UI thread, an open CompletionList must not be left waiting.
+    if not self.done:
+      self.done = True
+
+      for completion_list in self.completion_lists:
+        completion_list.set_completions([], COMPLETION_FLAGS)
+
+  def deliver(self, completions):
+    if not self.is_current():
+      self.cancel()
+      return
+
+    self.done = True
+    self.entry.completions = completions
+    CompletionCache.put(self.entry)
+
+    if self.completion_lists:
+      completions = self.entry.filter(self.view, self.view.sel()[0].b)
+
+      for completion_list in self.completion_lists:
+        completion_list.set_completions(completions, COMPLETION_FLAGS)
+    else:
+      # Sublime Text 3 has no deferred completions, the popup is opened
+      # again and answered from the cache.
+      self.view.run_command("hide_auto_complete")
+      self.view.run_command("auto_complete", {
+        "disable_auto_insert" : True,
+        "api_completions_only" : True,
+        "next_completion_if_showing" : False })
+
+class CompletionWorker:
+  """
+  Runs completions on a background thread. Only the latest request is
+  kept, a newer one or a cursor movement cancels it. Once the editor has
+  been idle for IDLE_DELAY seconds, recently edited files of the active
+  project which its navigator hasn't parsed yet are warmed up.
+  """
+
+  IDLE_DELAY = 1.0
+  RECENT_FILES = 8
+  RECENT_ROOTS = 16
+
+  instance = None
+
+  @staticmethod
+  def get():
+    if CompletionWorker.instance == None:
+      CompletionWorker.instance = CompletionWorker()
+
+    return CompletionWorker.instance
+
+  def __init__(self):
+    self.condition = threading.Condition()
+    self.pending = None
+    self.running = None
+    self.unsaved = UnsavedFiles()
+    self.last_activity = time.time()
+    self.active_root = None
+    # Root -> file name -> view, the most recently edited last.
+    self.recent = collections.OrderedDict()
+    # Root -> file names parsed by its navigator, evicted along with the pool.
+    self.warmed = collections.OrderedDict()
+    self.thread = threading.Thread(target = self.run, daemon = True)
+    self.thread.start()
+
+  def submit(self, view, start, location, completion_list = None):
+    with self.condition:
+      self.last_activity = time.time()
+
+      # Keystrokes within the token wait for the request already made for it.
+      for request in (self.pending, self.running):
+        if (request != None and not request.done and
+          request.view.id() == view.id() and request.start == start):
+          if completion_list != None:
+            request.completion_lists.append(completion_list)
+
+          return
+
+      request = CompletionRequest(view, start, location)
+
+      if completion_list != None:
+        request.completion_lists.append(completion_list)
+
+      stale, self.pending = self.pending, request
+      self.condition.notify()
+
+    if stale != None:
+      stale.cancel()
+
+    # The native call can't be interrupted, its late result is dropped.
+    sublime.set_timeout(request.cancel, completion_timeout())
+
+  def cancel_moved(self, view):
+    with self.condition:
+      requests = [self.pending, self.running]
+
+      if self.pending != None and not self.pending.is_current():
+        self.pending = None
+
+    for request in requests:
+      if request != None and request.view.id() == view.id() and not request.is_current():
+        request.cancel()
+
+  def edited(self, view):
+    root = project_root(view)
+
+    with self.condition:
+      self.last_activity = time.time()
+      recent = self.recent.pop(root, None) or collections.OrderedDict()
+      recent.pop(view.file_name(), None)
+      recent[view.file_name()] = view
+      self.recent[root] = recent
+
+      while len(recent) > self.RECENT_FILES:
+        recent.popitem(last = False)
+
+      while len(self.recent) > self.RECENT_ROOTS:
+        self.recent.popitem(last = False)
+
+      # The worker may be waiting without a timeout, with nothing to warm up.
+      self.condition.notify()
+
+  def activated(self, view):
+    with self.condition:
+      self.active_root = project_root(view)
+      self.condition.notify()
+
+  def next_warm_up(self):
+    recent = self.recent.get(self.active_root, {})
+    warmed = self.warmed.get(self.active_root, ())
+
+    for filename in reversed(recent):
+      view = recent[filename]
+
+      if not view.is_valid() or view.file_name() != filename:
+        del recent[filename]
+        return self.next_warm_up()
+
+      if filename not in warmed:
+        return (self.active_root, view)
+
+    return None
+
+  def parsed(self, root, filename):
+    with self.condition:
+      files = self.warmed.pop(root, None) or set()
+      files.add(filename)
+      self.warmed[root] = files
+
+      while len(self.warmed) > NavigatorPool.size():
+        self.warmed.popitem(last = False)
+
+  def run(self):
+    while True:
+      with self.condition:
+        idle_file = None
+
+        while self.pending == None:
+          idle_file = self.next_warm_up()
+          idle = time.time() - self.last_activity
+
+          if idle_file != None and idle >= self.IDLE_DELAY:
+            break
+
+          self.condition.wait(self.IDLE_DELAY - idle if idle_file != None else None)
+
+        if self.pending == None:
+          self.parsed(idle_file[0], idle_file[1].file_name())
+        else:
+          idle_file = None
+          request, self.pending = self.pending, None
+          self.running = request
+
+      if idle_file != None:
+        try:
+          self.warm_up_file(*idle_file)
+        except Exception:
+          traceback.print_exc()
+
+        continue
+
+      try:
+        completions = self.complete(request)
+
+        if completions != None:
+          sublime.set_timeout(lambda: request.deliver(completions), 0)
+      except Exception:
+        traceback.print_exc()
+        sublime.set_timeout(request.cancel, 0)
+      finally:
+        with self.condition:
+          self.running = None
+
+  def complete(self, request):
+    if not request.is_current():
+      sublime.set_timeout(request.cancel, 0)
+      return None
+
+    # Buffers are read here rather than on the UI thread.
+    entries = self.unsaved.collect(request.view)
+
+    if not request.is_current():
+      sublime.set_timeout(request.cancel, 0)
+      return None
+
+    self.parsed(request.root, request.filename)
+    completions = self.call_navigator(request.root, request.filename, request.row + 1, request.col + 1, entries)
+
+    if completions == None:
+      sublime.set_timeout(request.cancel, 0)
+
+    return completions
+
+  def warm_up_file(self, root, view):
+    # A completion at the start of the file parses it, the result is dropped.
+    print("Warming up {}.".format(view.file_name()))
+    self.call_navigator(root, view.file_name(), 1, 1, self.unsaved.collect(view))
+
+  def call_navigator(self, root, filename, line, column, entries):
+    """Completions by the navigator of `root`, None if it is unavailable or too slow."""
+    if NavigatorProcess.enabled():
+      process = NavigatorProcess.get()
+
+      if process == None:
+        return None
+
+      # An abandoned request doesn't hold up the next one.
+      return process.complete(root, filename, line, column, entries, completion_timeout() / 1000.0)
+
+    if not load_navigator():
+      return None
+
+    navigator = NavigatorPool.acquire(root, NavigatorPool.size())
+
+    if navigator == None:
+      return None
+
+    return code_complete_at(navigator, filename, line, column, self.unsaved.native())
+
+class CodeCompleteCommand(sublime_plugin.ViewEventListener):
   def on_query_completions(self, prefix, locations):
-    print(prefix, locations)
     location = locations[0]
 
-    flags = sublime.INHIBIT_WORD_COMPLETIONS | sublime.INHIBIT_EXPLICIT_COMPLETIONS
+    if not ("source.c++" in self.view.scope_name(location)) or not self.validate_colon(location):
+      return ([], COMPLETION_FLAGS)
 
-    last_completion = CodeCompleteCommand.last_completion
+    start = location - len(prefix)
+    entry = CompletionCache.get(self.view, start, location)
 
-    filename = self.view.file_name()
-    row, col = self.view.rowcol(location)
+    if entry != None:
+      return (entry.filter(self.view, location), COMPLETION_FLAGS)
 
-    print(last_completion, (filename, row, col - 1))
+    if hasattr(sublime, "CompletionList"):
+      completion_list = sublime.CompletionList()
+      CompletionWorker.get().submit(self.view, start, location, completion_list)
+      return completion_list
 
-    if last_completion == (filename, row, col - 1):
-      CodeCompleteCommand.last_completion = (filename, row, col)
-      return ([], flags)
+    CompletionWorker.get().submit(self.view, start, location)
+    return ([], COMPLETION_FLAGS)
 
-    if ("source.c++" in self.view.scope_name(location)) and self.validate_colon(location):
-      content = self.view.substr(sublime.Region(0, self.view.size()))
-      completions = code_complete_at(filename, row + 1, col + 1, [(filename, content)])
+  def on_activated_async(self):
+    if is_cpp(self.view):
+      warm_up()
+      CompletionWorker.get().activated(self.view)
 
-      CodeCompleteCommand.last_completion = (filename, row, col)
+  def on_modified(self):
+    CompletionCache.evict(self.view)
 
-      return (completions, flags)
-    else:
-      return ([], flags)
+    if self.view.file_name() and UnsavedFiles.is_source(self.view):
+      CompletionWorker.get().edited(self.view)
+
+  def on_selection_modified(self):
+    if CompletionWorker.instance != None:
+      CompletionWorker.instance.cancel_moved(self.view)
 
   def validate_colon(self, location):
     if location > 2:
@@ -1,4 +1,29 @@
 import sublime, sublime_plugin
+import array
+import bisect
+import collections
+import html
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+import weakref
+
+# Commands and listeners stay out of star imports, Sublime Text would
+# register them again for every module importing this one.
+__all__ = [
+    "clean_layout",
+    "collapse_group",
+    "window_state",
+    "OutputLog",
+    "OutputState",
+    "OutputView",
+    "BufferedOutput",
+    "ErrorPhantoms",
+    "default_phantom_layout",
+    "trim_view"]
 
 def clean_layout(layout):
     row_set = set()
@@ -26,13 +51,13 @@ def clean_layout(layout):
 
     return layout
 
-def collapse_group(group):
+def collapse_group(group, window = None):
     LEFT = 0
     TOP = 1
     RIGHT = 2
     BOTTOM = 3
 
-    window = sublime.active_window()
+    window = window if window != None else sublime.active_window()
     layout = window.get_layout()
     cells = layout["cells"]
 
@@ -56,29 +81,308 @@ def collapse_group(group):
 
     window.set_layout(clean_layout(layout))
 
+def window_state(states, window, factory):
+    """
+    Returns the state kept in `states` for `window`, created with
+    `factory` on first use. States of closed windows are dropped then.
+    """
+    state = states.get(window.id())
+
+    if state == None:
+        alive = set(other.id() for other in sublime.windows())
+
+        for window_id in list(states):
+            if window_id not in alive:
+                del states[window_id]
+
+        state = factory()
+        states[window.id()] = state
+
+    return state
+
+def find_lines_begin(buffer, end, count, newline):
+    """
+    Returns the position where the last `count` lines of `buffer[:end]`
+    begin and whether there were that many lines.
+    """
+    pos = end - 1
+
+    for _ in range(count):
+        pos = buffer.rfind(newline, 0, pos)
+
+        if pos == -1:
+            return 0, False
+
+    return pos + 1, True
+
+class OutputLog:
+    """
+    Append-only log of the Output view backed by a temporary file. Only a
+    bounded tail is kept in memory, older text is read back from the file
+    through mmap when it is needed. The start of every line is indexed
+    both as a byte and as a character offset.
+    """
+
+    TAIL_SIZE = 2**20
+
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.file = tempfile.TemporaryFile()
+        self.size = 0
+        self.length = 0
+        self.tail = collections.deque()
+        self.tail_length = 0
+        self.line_bytes = array.array("q", [0])
+        self.line_chars = array.array("q", [0])
+
+    def append(self, text):
+        """Appends `text` and returns the length of the log after it."""
+        data = text.encode("utf-8")
+
+        with self.mutex:
+            self._index(text, data)
+            self.file.write(data)
+            self.size += len(data)
+            self.length += len(text)
+            self.tail.append(text)
+            self.tail_length += len(text)
+
+            while len(self.tail) > 1 and self.tail_length - len(self.tail[0]) >= OutputLog.TAIL_SIZE:
+                self.tail_length -= len(self.tail.popleft())
+
+            return self.length
+
+    def _index(self, text, data):
+        byte_pos = data.find(b"\n")
+
+        if len(data) == len(text):
+            # ASCII, byte and character offsets move together.
+            while byte_pos != -1:
+                self.line_bytes.append(self.size + byte_pos + 1)
+                self.line_chars.append(self.length + byte_pos + 1)
+                byte_pos = data.find(b"\n", byte_pos + 1)
+        else:
+            char_pos = text.find("\n")
+
+            while byte_pos != -1:
+                self.line_bytes.append(self.size + byte_pos + 1)
+                self.line_chars.append(self.length + char_pos + 1)
+                byte_pos = data.find(b"\n", byte_pos + 1)
+                char_pos = text.find("\n", char_pos + 1)
+
+    def clear(self):
+        with self.mutex:
+            self.file.seek(0)
+            self.file.truncate()
+            self.size = 0
+            self.length = 0
+            self.tail.clear()
+            self.tail_length = 0
+            self.line_bytes = array.array("q", [0])
+            self.line_chars = array.array("q", [0])
+
+    def line_count(self):
+        """Number of lines, the last one might still be empty."""
+        with self.mutex:
+            return len(self.line_bytes)
+
+    def line_of(self, char):
+        """Returns the line containing character offset `char`."""
+        with self.mutex:
+            return max(0, bisect.bisect_right(self.line_chars, char) - 1)
+
+    def line_start(self, line):
+        """Returns the char and byte offsets where `line` begins."""
+        with self.mutex:
+            line = min(max(0, line), len(self.line_bytes) - 1)
+            return self.line_chars[line], self.line_bytes[line]
+
+    def lines(self, first, last):
+        """
+        Returns the text of lines `first` to `last` (exclusive), its char
+        and byte offsets and whether it reaches the end of the log.
+        """
+        with self.mutex:
+            count = len(self.line_bytes)
+            first = min(max(0, first), count - 1)
+            last = min(max(first, last), count)
+
+            byte_begin = self.line_bytes[first]
+            byte_end = self.line_bytes[last] if last < count else self.size
+
+            if byte_begin == byte_end:
+                return "", self.line_chars[first], byte_begin, last == count
+
+            self.file.flush()
+
+            with mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+                text = data[byte_begin:byte_end].decode("utf-8")
+
+            return text, self.line_chars[first], byte_begin, last == count
+
+    def search(self, pattern, limit = 1000):
+        """
+        Returns up to `limit` lines matching the bytes regex `pattern` as
+        (line, char begin, char end, text) tuples.
+        """
+        results = []
+
+        with self.mutex:
+            if self.size == 0:
+                return results
+
+            self.file.flush()
+
+            with mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+                previous = -1
+
+                for match in pattern.finditer(data, 0, self.size):
+                    line = bisect.bisect_right(self.line_bytes, match.start()) - 1
+
+                    if line == previous:
+                        continue
+
+                    previous = line
+                    begin = self.line_bytes[line]
+                    end = self.line_bytes[line + 1] if line + 1 < len(self.line_bytes) else self.size
+                    text = data[begin:end].decode("utf-8", "replace").rstrip("\n")
+                    char_begin = self.line_chars[line]
+                    results.append((line, char_begin, char_begin + len(text), text))
+
+                    if len(results) == limit:
+                        break
+
+        return results
+
+    def last_lines(self, count):
+        """Returns the last `count` lines and the char and byte offsets where they begin."""
+        with self.mutex:
+            text = "".join(self.tail)
+            self.tail.clear()
+            self.tail.append(text)
+
+            begin, complete = find_lines_begin(text, len(text), count, "\n")
+
+            if complete or self.tail_length == self.length:
+                text = text[begin:]
+                return text, self.length - len(text), self.size - len(text.encode("utf-8"))
+
+            if self.size == 0:
+                return "", 0, 0
+
+            self.file.flush()
+
+            with mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+                begin, _ = find_lines_begin(data, self.size, count, b"\n")
+                text = data[begin:self.size].decode("utf-8")
+
+            return text, self.length - len(text), begin
+
+    def lines_before(self, end, count):
+        """Returns `count` lines preceding byte offset `end` and the byte offset where they begin."""
+        with self.mutex:
+            if end == 0:
+                return "", 0
+
+            self.file.flush()
+
+            with mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+                begin, _ = find_lines_begin(data, end, count, b"\n")
+                return data[begin:end].decode("utf-8"), begin
+
+class OutputState:
+    """
+    Log of the Output view of one window, the part of it loaded into the
+    view and the scroll position to restore when the view is reopened.
+    """
+
+    def __init__(self):
+        self.log = OutputLog()
+        self.view_begin = 0
+        self.view_begin_byte = 0
+        self.view_first_line = 0
+        # End of the log part shown in the view, None while the view
+        # follows the end of the log.
+        self.view_end = None
+        # Number of lines kept in a virtualized view, None to keep all.
+        self.window_lines = None
+        self.position = 0.0
+
+    def reset(self):
+        self.view_begin = 0
+        self.view_begin_byte = 0
+        self.view_first_line = 0
+        self.view_end = None
+
 class OutputView:
-    content = ""
-    position = 0.0
-    id = None
+    # Output view and OutputState of each window by window id, maintained
+    # by OutputEventListener.
+    views = {}
+    states = {}
 
-    def __init__(self, view):
+    def __init__(self, view, owner = None):
         self.view = view
+        self.owner = owner if owner != None else view.window()
+        self.state = OutputView.state(self.owner)
+
+    @staticmethod
+    def state(window = None):
+        window = window if window != None else sublime.active_window()
+        return window_state(OutputView.states, window, OutputState)
 
     def __getattr__(self, name):
-        if self.view.id() != id:
-            output = OutputView.find_view()
+        # The view might have been closed and opened again in the meantime.
+        if not self.view.is_valid() and self.owner != None:
+            output = OutputView.find_view(self.owner)
             if output:
                 self.view = output.view
 
         return getattr(self.view, name)
 
     def clear(self):
-        OutputView.content = ""
+        self.state.log.clear()
+        self.state.reset()
         self.run_command("output_view_clear")
 
     def append(self, text):
-        OutputView.content += text
-        self.run_command("output_view_append", { "text" : text })
+        end = self.state.log.append(text)
+
+        # A view paged away from the end catches up when paged back.
+        if self.state.view_end == None:
+            self.run_command("output_view_append", { "text" : text, "end" : end })
+
+    def to_view_region(self, begin, end):
+        """Translates a region of the log into a region of the Output view."""
+        state = self.state
+
+        if begin < state.view_begin or state.view_end != None and end > state.view_end:
+            return None
+
+        return sublime.Region(begin - state.view_begin, end - state.view_begin)
+
+    def page(self, first, last):
+        """Replaces the content of the view with lines `first` to `last` of the log."""
+        self.run_command("output_view_page", { "first" : first, "last" : last })
+
+    def reveal(self, begin, end):
+        """
+        Like to_view_region(), but pages in the lines around the region
+        if the view doesn't show it.
+        """
+        region = self.to_view_region(begin, end)
+
+        if region == None:
+            lines = self.state.window_lines or OutputView.window_lines()
+            line = self.state.log.line_of(begin)
+            self.page(line - lines // 2, line + lines // 2)
+            region = self.to_view_region(begin, end)
+
+        return region
+
+    @staticmethod
+    def window_lines():
+        settings = sublime.load_settings("Preferences.sublime-settings")
+        return settings.get("minion_output_window_lines", 10000)
 
     def append_finish_message(self, command, working_dir, return_code, elapsed_time):
         if return_code != 0:
@@ -89,48 +393,66 @@ class OutputView:
         else:
             self.append("[Finished in {:.2f}s]\n".format(elapsed_time))
 
-    def _collapse(self, group):
-        window = sublime.active_window()
+    def _collapse(self, window, group):
         views = window.views_in_group(group)
 
         if (len(views) == 0 or len(views) == 1 and
             views[0].id() == self.view.id()):
-            collapse_group(group)
+            collapse_group(group, window)
 
-    def _close(self):
-        window = sublime.active_window()
+    def _close(self, window):
         group, index = window.get_view_index(self.view)
         window.run_command("close_by_index", {"group": group, "index": index})
-        self._collapse(group)
-        OutputView.id = None
+        self._collapse(window, group)
+        OutputView.views.pop(window.id(), None)
 
     @staticmethod
-    def close():
-        window = sublime.active_window()
+    def is_output(view):
+        return view.is_scratch() and view.name() == "Output"
 
-        for view in window.views():
-            if view.is_scratch() and view.name() == "Output":
-                OutputView(view)._close()
+    @staticmethod
+    def close(window = None):
+        window = window if window != None else sublime.active_window()
+        output = OutputView.find_view(window)
+
+        if output:
+            output._close(window)
 
     @staticmethod
-    def find_view():
-        window = sublime.active_window()
+    def find_view(window = None):
+        window = window if window != None else sublime.active_window()
+        view = OutputView.views.get(window.id())
+
+        if view != None and view.is_valid():
+            owner = view.window()
 
+            if owner != None and owner.id() == window.id():
+                return OutputView(view, window)
+
+        OutputView.views.pop(window.id(), None)
+
+        # Not registered yet, e.g. a view restored with the session.
         for view in window.views():
-            if view.is_scratch() and view.name() == "Output":
-                return OutputView(view)
+            if OutputView.is_output(view):
+                OutputView.views[window.id()] = view
+                return OutputView(view, window)
 
         return None
 
     @staticmethod
-    def create():
-        view = OutputView.request()
+    def create(window = None):
+        view = OutputView.request(window)
         view.clear()
         return view
 
     @staticmethod
-    def request():
-        window = sublime.active_window()
+    def request(window = None):
+        window = window if window != None else sublime.active_window()
+        output = OutputView.find_view(window)
+
+        if output:
+            return output
+
         num_groups = window.num_groups()
 
         if num_groups < 3:
@@ -158,54 +480,418 @@ class OutputView:
 
         num_groups = window.num_groups()
         views = window.views_in_group(num_groups - 1)
-        output = None
 
-        for view in views:
-            if view.name() == "Output" and view.is_scratch():
-                output = view
+        active = window.active_view()
+        output = window.new_file()
+        output.settings().set("line_numbers", False)
+        output.settings().set("scroll_past_end", False)
+        output.settings().set("scroll_speed", 0.0)
+        output.settings().set("gutter", False)
+        output.settings().set("spell_check", False)
+        output.set_scratch(True)
+        output.set_name("Output")
+
+        # Replay the tail of this window's log.
+        state = OutputView.state(window)
+        settings = sublime.load_settings("Preferences.sublime-settings")
+        lines = OutputView.window_lines()
+        state.window_lines = lines if settings.get("minion_output_virtualized", True) else None
+
+        text, state.view_begin, state.view_begin_byte = state.log.last_lines(lines)
+        state.view_first_line = state.log.line_of(state.view_begin)
+        state.view_end = None
+        output.run_command("output_view_append", { "text" : text })
+
+        def update():
+            output.set_viewport_position((0, state.position), False)
+
+        sublime.set_timeout(update, 0.0)
+
+        OutputView.views[window.id()] = output
+        window.set_view_index(output, num_groups - 1, len(views))
+        window.focus_view(active)
+
+        return OutputView(output, window)
+
+
+class BufferedOutput:
+    """
+    Batches text appended from a worker thread and forwards it to
+    an OutputView in chunks bounded by size and by frame time.
+    """
+
+    FRAME_TIME = 16
+    CHUNK_SIZE = 2**16
+
+    def __init__(self, output, listener = None):
+        self.output = output
+        self.listener = listener
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = []
+        self.pending_size = 0
+        self.last_flush = time.time()
+        self.scheduled = False
+        self.append_time = 0.0
+        self.flush_time = 0.0
+
+    def __getattr__(self, name):
+        self.flush()
+        return getattr(self.output, name)
+
+    def append(self, text):
+        begin = time.perf_counter()
+
+        if self.listener:
+            self.listener(text)
 
-        if output == None:
-            active = window.active_view()
-            output = window.new_file()
-            output.settings().set("line_numbers", False)
-            output.settings().set("scroll_past_end", False)
-            output.settings().set("scroll_speed", 0.0)
-            output.settings().set("gutter", False)
-            output.settings().set("spell_check", False)
-            output.set_scratch(True)
-            output.set_name("Output")
-            output.run_command("output_view_append", { "text" : OutputView.content })
+        with self.lock:
+            self.pending.append(text)
+            self.pending_size += len(text)
 
-            def update():
-                output.set_viewport_position((0, OutputView.position), False)
+            due = (self.pending_size >= BufferedOutput.CHUNK_SIZE or
+                time.time() - self.last_flush >= BufferedOutput.FRAME_TIME / 1000)
 
-            sublime.set_timeout(update, 0.0)
+            schedule = not due and not self.scheduled
+            self.scheduled = self.scheduled or schedule
 
-            OutputView.id = output.id()
-            window.set_view_index(output, num_groups - 1, len(views))
-            window.focus_view(active)
+        if due:
+            self.flush()
+        elif schedule:
+            sublime.set_timeout(self._on_frame, BufferedOutput.FRAME_TIME)
+
+        self.append_time += time.perf_counter() - begin
+
+    def append_finish_message(self, command, working_dir, return_code, elapsed_time):
+        OutputView.append_finish_message(self, command, working_dir, return_code, elapsed_time)
 
-        return OutputView(output)
+    def _on_frame(self):
+        with self.lock:
+            self.scheduled = False
 
+        # Never block the UI thread, a worker holding the lock flushes anyway.
+        if self.flush_lock.acquire(False):
+            try:
+                self._flush()
+            finally:
+                self.flush_lock.release()
+
+    def _flush(self):
+        with self.lock:
+            if len(self.pending) == 0:
+                return
+
+            text = "".join(self.pending)
+            self.pending = []
+            self.pending_size = 0
+            self.last_flush = time.time()
+
+        begin = time.perf_counter()
+        self.output.append(text)
+        self.flush_time += time.perf_counter() - begin
+
+    def flush(self):
+        with self.flush_lock:
+            self._flush()
+
+    def clear(self):
+        with self.flush_lock:
+            with self.lock:
+                self.pending = []
+                self.pending_size = 0
+
+            self.output.clear()
+
+PHANTOM_TEMPLATE = ('''<body id=inline-error>
+    <style>
+        div.error {
+            padding: 0.4rem 0 0.4rem 0.7rem;
+            margin: 0.2rem 0;
+            border-radius: 2px;
+        }
+
+        div.error span.message {
+            padding-right: 0.7rem;
+        }
+
+        div.error a {
+            text-decoration: inherit;
+            padding: 0.35rem 0.7rem 0.45rem 0.8rem;
+            position: relative;
+            bottom: 0.05rem;
+            border-radius: 0 2px 2px 0;
+            font-weight: bold;
+        }
+        html.dark div.error a {
+            background-color: #00000018;
+        }
+        html.light div.error a {
+            background-color: #ffffff18;
+        }
+    </style>
+    <div class="error"><span class="message">%s</span><a href=hide>''' + chr(0x00D7) + '''</a></div>
+</body>''')
+
+def default_phantom_layout(line, column, text):
+    return line, 0, html.escape(text, quote = False)
+
+class ErrorPhantoms:
+    """
+    Inline error phantoms for a set of errors grouped by file. Phantoms
+    are rendered only for visible views, other views are rendered when
+    they get loaded or activated. A file is re-rendered only if its
+    errors changed since the last time.
+    """
+
+    MAX_PER_FILE = 32
+    instances = weakref.WeakSet()
+
+    def __init__(self, key, on_navigate = None, layout = default_phantom_layout):
+        self.key = key
+        self.on_navigate = on_navigate
+        self.layout = layout
+        self.window_id = None
+        self.errors = {}
+        self.rendered = {}
+        ErrorPhantoms.instances.add(self)
+
+    def update(self, window, errors_by_file):
+        self.window_id = window.id()
+        self.errors = {
+            file : tuple(errors[:ErrorPhantoms.MAX_PER_FILE])
+            for file, errors in errors_by_file.items() }
+
+        for group in range(window.num_groups()):
+            view = window.active_view_in_group(group)
+
+            if view:
+                self.render(view)
+
+    def render(self, view):
+        file = view.file_name()
+
+        if not file:
+            return
+
+        # Errors of a build belong to the window it ran in.
+        window = view.window()
+
+        if self.window_id != None and (window == None or window.id() != self.window_id):
+            return
+
+        errors = self.errors.get(file)
+
+        if errors == None:
+            errors = self.errors.get(os.path.realpath(file), ())
+
+        buffer_id = view.buffer_id()
+        rendered, phantom_set = self.rendered.get(buffer_id, ((), None))
+
+        if rendered == errors:
+            return
+
+        if phantom_set == None:
+            phantom_set = sublime.PhantomSet(view, self.key)
+
+        phantoms = []
+
+        for line, column, text in errors:
+            line, column, escaped = self.layout(line, column, text)
+            pt = view.text_point(line - 1, column)
+            phantoms.append(sublime.Phantom(
+                sublime.Region(pt, view.line(pt).b),
+                PHANTOM_TEMPLATE % escaped,
+                sublime.LAYOUT_BELOW,
+                on_navigate = self.on_navigate or self.clear))
+
+        phantom_set.update(phantoms)
+        self.rendered[buffer_id] = (errors, phantom_set)
+
+    def clear(self, url = None):
+        for _, phantom_set in self.rendered.values():
+            phantom_set.update([])
+
+        self.errors = {}
+        self.rendered = {}
+
+    def forget(self, view):
+        self.rendered.pop(view.buffer_id(), None)
+
+class ErrorPhantomsListener(sublime_plugin.EventListener):
+    def on_load(self, view):
+        for phantoms in list(ErrorPhantoms.instances):
+            phantoms.render(view)
+
+    def on_activated(self, view):
+        for phantoms in list(ErrorPhantoms.instances):
+            phantoms.render(view)
+
+    def on_close(self, view):
+        for phantoms in list(ErrorPhantoms.instances):
+            phantoms.forget(view)
 
 class OutputViewClearCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         self.view.erase(edit, sublime.Region(0, self.view.size()))
 
+def trim_view(view, edit, state, end_line, keep_viewport = False):
+    """
+    Drops the oldest lines once the view, which ends before `end_line` of
+    the log, holds twice its window. They stay available in the log.
+    """
+    if end_line - state.view_first_line <= 2 * state.window_lines:
+        return
+
+    first = end_line - state.window_lines
+    char, byte = state.log.line_start(first)
+    erased = char - state.view_begin
+
+    if erased > view.size():
+        return
+
+    if keep_viewport:
+        # What was on screen stays in place.
+        position = view.viewport_position()
+        height = view.text_to_layout(erased)[1]
+
+    view.erase(edit, sublime.Region(0, erased))
+    state.view_begin, state.view_begin_byte, state.view_first_line = char, byte, first
+
+    if keep_viewport:
+        view.set_viewport_position((position[0], max(0, position[1] - height)), False)
+
 class OutputViewAppendCommand(sublime_plugin.TextCommand):
-    def run(self, edit, text):
-        scroll = self.view.visible_region().end() == self.view.size()
+    def run(self, edit, text, end = None):
         view = self.view
+        window = view.window()
+        state = OutputView.state(window) if window != None else None
+
+        if state != None and end != None:
+            # Skip what a page command already brought in from the log.
+            shown = state.view_begin + view.size()
+
+            if end <= shown:
+                return
+
+            text = text[max(0, len(text) - (end - shown)):]
+
+        scroll = view.visible_region().end() == view.size()
         view.insert(edit, view.size(), text)
 
+        if scroll and state != None and state.window_lines:
+            trim_view(view, edit, state, state.log.line_count())
+
         if scroll:
             viewport = view.viewport_extent()
             last_line = view.text_to_layout(view.size())
             view.set_viewport_position((0, last_line[1] - viewport[1]), False)
 
+
+class OutputViewPageCommand(sublime_plugin.TextCommand):
+    def run(self, edit, first, last):
+        state = OutputView.state(self.view.window())
+        text, begin, begin_byte, complete = state.log.lines(first, last)
+
+        self.view.replace(edit, sublime.Region(0, self.view.size()), text)
+
+        state.view_begin = begin
+        state.view_begin_byte = begin_byte
+        state.view_first_line = state.log.line_of(begin)
+        state.view_end = None if complete else begin + len(text)
+
+class OutputViewLoadOlderCommand(sublime_plugin.TextCommand):
+    def run(self, edit, lines = 1000):
+        state = OutputView.state(self.view.window())
+        text, begin = state.log.lines_before(state.view_begin_byte, lines)
+
+        if text:
+            view = self.view
+            position = view.viewport_position()
+            view.insert(edit, 0, text)
+            view.set_viewport_position((position[0], position[1] + view.text_to_layout(len(text))[1]), False)
+
+            state.view_begin -= len(text)
+            state.view_begin_byte = begin
+            state.view_first_line -= text.count("\n")
+
+class OutputViewLoadNewerCommand(sublime_plugin.TextCommand):
+    def run(self, edit, lines = 1000):
+        state = OutputView.state(self.view.window())
+
+        if state.view_end == None:
+            return
+
+        first = state.log.line_of(state.view_end)
+        text, begin, _, complete = state.log.lines(first, first + lines)
+
+        view = self.view
+        view.insert(edit, view.size(), text)
+        state.view_end = None if complete else begin + len(text)
+
+        if state.window_lines:
+            end_line = state.log.line_count() if complete else state.log.line_of(state.view_end)
+            trim_view(view, edit, state, end_line, keep_viewport = True)
+
+class OutputLoadOlderCommand(sublime_plugin.WindowCommand):
+    def run(self, lines = 1000):
+        output = OutputView.find_view(self.window)
+
+        if output:
+            output.view.run_command("output_view_load_older", { "lines" : lines })
+
+class OutputLoadNewerCommand(sublime_plugin.WindowCommand):
+    def run(self, lines = 1000):
+        output = OutputView.find_view(self.window)
+
+        if output:
+            output.view.run_command("output_view_load_newer", { "lines" : lines })
+
+class OutputSearchCommand(sublime_plugin.WindowCommand):
+    """Searches the whole log of the Output view, not only what the view holds."""
+
+    def run(self, pattern = None, regex = False):
+        if pattern == None:
+            self.window.show_input_panel(
+                "Search output:", "", lambda text: self.search(text, regex), None, None)
+        else:
+            self.search(pattern, regex)
+
+    def search(self, pattern, regex):
+        if not pattern:
+            return
+
+        try:
+            compiled = re.compile((pattern if regex else re.escape(pattern)).encode("utf-8"))
+        except re.error as error:
+            sublime.status_message("Invalid pattern: {}".format(error))
+            return
+
+        results = OutputView.state(self.window).log.search(compiled)
+
+        if not results:
+            sublime.status_message("No matches in the output.")
+            return
+
+        items = ["{}: {}".format(line + 1, text.strip()) for line, _, _, text in results]
+
+        def on_done(index):
+            if index != -1:
+                _, begin, end, _ = results[index]
+                self.show(begin, end)
+
+        self.window.show_quick_panel(items, on_done)
+
+    def show(self, begin, end):
+        output = OutputView.request(self.window)
+        region = output.reveal(begin, end)
+
+        if region != None:
+            output.add_regions("output_search", [region], "comment", flags = sublime.DRAW_NO_FILL)
+            output.show_at_center(region)
+
 class OpenOutputCommand(sublime_plugin.WindowCommand):
     def run(self):
-        OutputView.request()
+        OutputView.request(self.window)
 
 class CloseOutputCommand(sublime_plugin.ApplicationCommand):
     def run(self):
@@ -215,10 +901,17 @@ class OutputEventListener(sublime_plugin.EventListener):
     def on_query_context(self, view, key, operator, operand, match_all):
         print(key)
         if key == "output_visible":
-            return OutputView.find_view() != None
+            window = view.window()
+            return window != None and OutputView.find_view(window) != None
         else:
             return None
 
     def on_close(self, view):
-        if view.is_scratch() and view.name() == "Output":
-            OutputView.position = view.viewport_position()[1]
+        if OutputView.is_output(view):
+            # The view is already detached from its window here.
+            for window_id, output in list(OutputView.views.items()):
+                if output.id() == view.id():
+                    del OutputView.views[window_id]
+
+                    if window_id in OutputView.states:
+                        OutputView.states[window_id].position = view.viewport_position()[1]
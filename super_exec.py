@@ -1,32 +1,304 @@
+import codecs
 import collections
 import functools
-import html
 import os
+import re
+import select
 import subprocess
 import sys
 import threading
 import time
+import traceback
 
 import sublime
 import sublime_plugin
 
 from User.output import *
+from User.telemetry import *
+from User.launcher import *
 
 class ProcessListener(object):
-    def on_data(self, proc, data):
+    def on_data(self, proc, data, stream=None):
         pass
 
     def on_finished(self, proc):
         pass
 
 
+class ProcessReactor(object):
+    """
+    Single thread reading the output pipes of all running AsyncProcesses,
+    multiplexed with poll(2). A process is reported finished only after
+    both of its streams are closed and it has been reaped. The pipes of a
+    paused process are left out of the poll set until it is resumed, its
+    callbacks never wait for the consumer.
+    """
+
+    READ_SIZE = 2**15
+    REAP_INTERVAL = 50
+
+    instance = None
+    instance_lock = threading.Lock()
+
+    @classmethod
+    def get(klass):
+        with klass.instance_lock:
+            if klass.instance is None:
+                klass.instance = ProcessReactor()
+
+            return klass.instance
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.incoming = []
+        self.changes = []
+        self.streams = {}
+        self.paused = set()
+        self.open_streams = {}
+        self.reaping = []
+        self.buffer = bytearray(self.READ_SIZE)
+        self.buffer_view = memoryview(self.buffer)
+        self.poll = select.poll()
+        self.wake_read, self.wake_write = os.pipe()
+        self.poll.register(self.wake_read, select.POLLIN)
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def register(self, proc):
+        with self.lock:
+            self.incoming.append(proc)
+
+        os.write(self.wake_write, b"\0")
+
+    def pause(self, proc):
+        self._change(proc, False)
+
+    def resume(self, proc):
+        self._change(proc, True)
+
+    def _change(self, proc, reading):
+        with self.lock:
+            self.changes.append((proc, reading))
+
+        # Changes made from a callback are applied before the next poll.
+        if threading.current_thread() is not self.thread:
+            os.write(self.wake_write, b"\0")
+
+    def _apply_changes(self):
+        with self.lock:
+            changes, self.changes = self.changes, []
+
+        for proc, reading in changes:
+            for fd, (owner, file) in list(self.streams.items()):
+                if owner is not proc:
+                    continue
+
+                if reading and fd in self.paused:
+                    self.paused.discard(fd)
+                    self.poll.register(fd, select.POLLIN)
+                elif not reading and fd not in self.paused:
+                    self.paused.add(fd)
+                    self.poll.unregister(fd)
+
+    def _register_incoming(self):
+        with self.lock:
+            incoming, self.incoming = self.incoming, []
+
+        for proc in incoming:
+            files = [file for file in (proc.proc.stdout, proc.proc.stderr) if file]
+            self.open_streams[proc] = len(files)
+
+            for file in files:
+                self.streams[file.fileno()] = (proc, file)
+                self.poll.register(file.fileno(), select.POLLIN)
+
+            if not files:
+                self.reaping.append(proc)
+
+    def _close(self, fd):
+        proc, file = self.streams.pop(fd)
+
+        if fd in self.paused:
+            self.paused.discard(fd)
+        else:
+            self.poll.unregister(fd)
+
+        file.close()
+
+        self.open_streams[proc] -= 1
+
+        if self.open_streams[proc] == 0:
+            del self.open_streams[proc]
+            self.reaping.append(proc)
+
+    def _reap(self):
+        for proc in list(self.reaping):
+            if proc.proc.poll() is not None:
+                self.reaping.remove(proc)
+                self._dispatch(proc.on_finished)
+
+    def _dispatch(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception:
+            traceback.print_exc()
+
+    def run(self):
+        while True:
+            timeout = self.REAP_INTERVAL if self.reaping else None
+
+            for fd, event in self.poll.poll(timeout):
+                if fd == self.wake_read:
+                    os.read(fd, 512)
+                    continue
+
+                if fd not in self.streams:
+                    continue
+
+                size = 0
+
+                if not event & select.POLLNVAL:
+                    size = os.readv(fd, [self.buffer])
+
+                if size > 0:
+                    # The view is only valid until the next read, listeners
+                    # have to consume it before returning.
+                    proc = self.streams[fd][0]
+                    self._dispatch(proc.on_data, self.buffer_view[:size], fd)
+                else:
+                    self._close(fd)
+
+            self._register_incoming()
+            self._apply_changes()
+            self._reap()
+
+
+class ResultMatcher(object):
+    """
+    Incremental counterpart of View.find_all_results_with_text(). Only the
+    text appended since the previous call is scanned, results are merged
+    into a persistent per-file index.
+    """
+
+    def __init__(self, file_regex, line_regex, base_dir):
+        self.file_regex = re.compile(file_regex) if file_regex else None
+        self.line_regex = re.compile(line_regex) if line_regex else None
+        self.base_dir = base_dir
+        self.partial = ""
+        self.current_file = None
+        self.paths = {}
+        self.errs_by_file = {}
+        self.count = 0
+
+    def feed(self, text):
+        """Scans appended text, returns the number of new results."""
+        count = self.count
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+
+        for line in lines:
+            self.match(line)
+
+        return self.count - count
+
+    def path(self, file):
+        path = self.paths.get(file)
+
+        if path is None:
+            path = os.path.normpath(os.path.join(self.base_dir, file))
+            self.paths[file] = path
+
+        return path
+
+    @staticmethod
+    def number(text):
+        """`text` as an int, None unless it is a decimal number."""
+        text = text.strip() if text else ""
+        return int(text) if text.isdecimal() else None
+
+    def match(self, line):
+        groups = None
+
+        if self.file_regex:
+            match = self.file_regex.search(line)
+
+            if match:
+                groups = match.groups()
+                self.current_file = self.path(groups[0]) if groups and groups[0] else None
+                groups = groups[1:]
+
+        if groups is None and self.line_regex and self.current_file:
+            match = self.line_regex.search(line)
+
+            if match:
+                groups = match.groups()
+
+        if groups and groups[0] and self.current_file:
+            groups = groups + (None,) * (3 - len(groups))
+
+            # Sublime Text accepts regexes whose groups don't capture
+            # numbers, such lines are no results.
+            line = self.number(groups[0])
+
+            if line is None:
+                return
+
+            if self.current_file not in self.errs_by_file:
+                self.errs_by_file[self.current_file] = []
+
+            self.errs_by_file[self.current_file].append(
+                (line, self.number(groups[1]) or 0, groups[2] or ""))
+            self.count += 1
+
+
+class StreamDecoder(object):
+    """
+    Decodes one output stream chunk by chunk. Multi-byte characters and
+    CR LF pairs split between reads are carried over to the next chunk,
+    newlines are normalized in the same pass.
+    """
+
+    NEWLINES = re.compile("\r\n?")
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.carriage_return = False
+
+    def decode(self, data, final=False):
+        prefix = ""
+
+        try:
+            text = self.decoder.decode(data, final)
+        except UnicodeDecodeError:
+            # Keep the stream going, undecodable bytes are replaced from now on.
+            prefix = "[Decode error - output not " + self.encoding + "]\n"
+            self.decoder.errors = "replace"
+            text = self.decoder.decode(data, final)
+
+        if self.carriage_return:
+            text = "\r" + text
+
+        self.carriage_return = not final and text.endswith("\r")
+
+        if self.carriage_return:
+            text = text[:-1]
+
+        # Sublime Text always uses a single \n separator in memory.
+        if "\r" in text:
+            text = self.NEWLINES.sub("\n", text)
+
+        return prefix + text if prefix else text
+
+
 class AsyncProcess(object):
     """
     Encapsulates subprocess.Popen, forwarding stdout to a supplied
-    ProcessListener (on a separate thread)
+    ProcessListener (on the shared ProcessReactor thread)
     """
 
-    def __init__(self, cmd, shell_cmd, env, listener, path="", shell=False):
+    def __init__(self, cmd, shell_cmd, env, listener, working_dir="", path="", shell=False):
         """ "path" and "shell" are options in build systems """
 
         if not shell_cmd and not cmd:
@@ -37,8 +309,13 @@ class AsyncProcess(object):
 
         self.listener = listener
         self.killed = False
+        self.decoders = {}
+        self.reactor = None
+        self.reading = threading.Event()
+        self.reading.set()
 
         self.start_time = time.time()
+        self.telemetry = BuildTelemetry(shell_cmd or cmd, working_dir or os.getcwd())
 
         # Hide the console window on Windows
         startupinfo = None
@@ -46,69 +323,44 @@ class AsyncProcess(object):
             startupinfo = subprocess.STARTUPINFO()
             startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
 
-        # Set temporary PATH to locate executable in cmd
-        if path:
-            old_path = os.environ["PATH"]
-            # The user decides in the build system whether he wants to append $PATH
-            # or tuck it at the front: "$PATH;C:\\new\\path", "C:\\new\\path;$PATH"
-            os.environ["PATH"] = os.path.expandvars(path)
-
-        proc_env = os.environ.copy()
-        proc_env.update(env)
-        for k, v in proc_env.items():
-            proc_env[k] = os.path.expandvars(v)
-
         if shell_cmd and sys.platform == "win32":
             # Use shell=True on Windows, so shell_cmd is passed through with the correct escaping
-            self.proc = subprocess.Popen(
-                shell_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                stdin=subprocess.PIPE,
-                startupinfo=startupinfo,
-                env=proc_env,
-                shell=True)
+            args, shell = shell_cmd, True
         elif shell_cmd and sys.platform == "darwin":
             # Use a login shell on OSX, otherwise the users expected env vars won't be setup
-            self.proc = subprocess.Popen(
-                ["/bin/bash", "-l", "-c", shell_cmd],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                stdin=subprocess.PIPE,
-                startupinfo=startupinfo,
-                env=proc_env,
-                shell=False)
+            args, shell = ["/bin/bash", "-l", "-c", shell_cmd], False
         elif shell_cmd and sys.platform == "linux":
             # Explicitly use /bin/bash on Linux, to keep Linux and OSX as
             # similar as possible. A login shell is explicitly not used for
             # linux, as it's not required
-            self.proc = subprocess.Popen(
-                ["/bin/bash", "-c", shell_cmd],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                stdin=subprocess.PIPE,
-                startupinfo=startupinfo,
-                env=proc_env,
-                shell=False)
+            args, shell = ["/bin/bash", "-c", shell_cmd], False
         else:
             # Old style build system, just do what it asks
-            self.proc = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                stdin=subprocess.PIPE,
-                startupinfo=startupinfo,
-                env=proc_env,
-                shell=shell)
-
-        if path:
-            os.environ["PATH"] = old_path
-
-        if self.proc.stdout:
-            threading.Thread(target=self.read_stdout).start()
+            args = cmd
+
+        # "path" is the PATH used to locate the executable in cmd, the
+        # environment of the plugin host itself is left alone.
+        self.proc = launch(
+            args,
+            cwd=working_dir,
+            env=env,
+            path=path,
+            shell=shell,
+            startupinfo=startupinfo,
+            stdin=subprocess.PIPE)
+
+        self.telemetry.spawned()
+
+        if hasattr(select, "poll"):
+            self.reactor = ProcessReactor.get()
+            self.reactor.register(self)
+        else:
+            # poll(2) doesn't work on Windows pipes, read each one on its own thread
+            if self.proc.stdout:
+                threading.Thread(target=self.read_stdout).start()
 
-        if self.proc.stderr:
-            threading.Thread(target=self.read_stderr).start()
+            if self.proc.stderr:
+                threading.Thread(target=self.read_stderr).start()
 
     def kill(self):
         if not self.killed:
@@ -125,32 +377,58 @@ class AsyncProcess(object):
                 self.proc.terminate()
             self.listener = None
 
+            # The pipes are read to the end so that the process is reaped.
+            self.resume_reading()
+
+    def pause_reading(self):
+        """Stops reading the output until resume_reading(), the full pipes then hold the process up."""
+        self.reading.clear()
+
+        if self.reactor:
+            self.reactor.pause(self)
+
+    def resume_reading(self):
+        if not self.reading.is_set():
+            self.reading.set()
+
+            if self.reactor:
+                self.reactor.resume(self)
+
     def poll(self):
         return self.proc.poll() is None
 
     def exit_code(self):
         return self.proc.poll()
 
+    def on_data(self, data, stream=None):
+        self.telemetry.received(len(data), 0)
+
+        if self.listener:
+            self.listener.on_data(self, data, stream)
+
+    def on_finished(self):
+        if self.listener:
+            self.listener.on_finished(self)
+
     def read_stdout(self):
         while True:
+            self.reading.wait()
             data = os.read(self.proc.stdout.fileno(), 2**15)
 
             if len(data) > 0:
-                if self.listener:
-                    self.listener.on_data(self, data)
+                self.on_data(data, self.proc.stdout.fileno())
             else:
                 self.proc.stdout.close()
-                if self.listener:
-                    self.listener.on_finished(self)
+                self.on_finished()
                 break
 
     def read_stderr(self):
         while True:
+            self.reading.wait()
             data = os.read(self.proc.stderr.fileno(), 2**15)
 
             if len(data) > 0:
-                if self.listener:
-                    self.listener.on_data(self, data)
+                self.on_data(data, self.proc.stderr.fileno())
             else:
                 self.proc.stderr.close()
                 break
@@ -158,16 +436,33 @@ class AsyncProcess(object):
 
 class SuperExecCommand(sublime_plugin.WindowCommand, ProcessListener):
     BLOCK_SIZE = 2**14
-    text_queue = collections.deque()
+    # Reading the output of the process pauses once this many characters
+    # are queued for the view, and resumes once half of them are shown.
+    MAX_QUEUED = 2**24
+    # Time a single service_text_queue call may spend appending, in seconds.
+    FRAME_BUDGET = 0.008
+    text_queue_size = 0
     text_queue_proc = None
-    text_queue_lock = threading.Lock()
+    throttled = None
+
+    # Running estimate of the time it takes to append one character.
+    append_cost = 1e-7
+    finishing = None
 
     proc = None
 
     errs_by_file = {}
-    phantom_sets_by_buffer = {}
     show_errors_inline = True
 
+    def __init__(self, window):
+        super().__init__(window)
+
+        # Each window queues its own output.
+        self.text_queue = collections.deque()
+        self.text_queue_lock = threading.Lock()
+
+        self.phantoms = ErrorPhantoms("exec", self.on_phantom_navigate)
+
     def run(
             self,
             cmd=None,
@@ -199,10 +494,14 @@ class SuperExecCommand(sublime_plugin.WindowCommand, ProcessListener):
         self.text_queue_lock.acquire()
         try:
             self.text_queue.clear()
+            self.text_queue_size = 0
             self.text_queue_proc = None
+            self.resume_throttled()
         finally:
             self.text_queue_lock.release()
 
+        self.finish_telemetry()
+
         if kill:
             if self.proc:
                 self.proc.kill()
@@ -212,7 +511,7 @@ class SuperExecCommand(sublime_plugin.WindowCommand, ProcessListener):
 
         if not hasattr(self, 'output_view'):
             # Try not to call get_output_panel until the regexes are assigned
-            self.output_view = OutputView.create()
+            self.output_view = OutputView.create(self.window)
 
         # Default the to the current files directory if no working directory was given
         if working_dir == "" and self.window.active_view() and self.window.active_view().file_name():
@@ -220,6 +519,7 @@ class SuperExecCommand(sublime_plugin.WindowCommand, ProcessListener):
 
         self.output_view.settings().set("result_file_regex", file_regex)
         self.output_view.settings().set("result_line_regex", line_regex)
+        self.result_matcher = ResultMatcher(file_regex, line_regex, working_dir)
         self.output_view.settings().set("result_base_dir", working_dir)
         self.output_view.settings().set("word_wrap", word_wrap)
         self.output_view.settings().set("line_numbers", False)
@@ -229,7 +529,7 @@ class SuperExecCommand(sublime_plugin.WindowCommand, ProcessListener):
 
         # Call create_output_panel a second time after assigning the above
         # settings, so that it'll be picked up as a result buffer
-        OutputView.create()
+        OutputView.create(self.window)
 
         self.encoding = encoding
         self.quiet = quiet
@@ -245,7 +545,7 @@ class SuperExecCommand(sublime_plugin.WindowCommand, ProcessListener):
 
         show_panel_on_build = sublime.load_settings("Preferences.sublime-settings").get("show_panel_on_build", True)
         if show_panel_on_build:
-            OutputView.request()
+            OutputView.request(self.window)
 
         self.hide_phantoms()
         self.show_errors_inline = sublime.load_settings("Preferences.sublime-settings").get("show_errors_inline", True)
@@ -256,17 +556,12 @@ class SuperExecCommand(sublime_plugin.WindowCommand, ProcessListener):
             if user_env:
                 merged_env.update(user_env)
 
-        # Change to the working dir, rather than spawning the process with it,
-        # so that emitted working dir relative path names make sense
-        if working_dir != "":
-            os.chdir(working_dir)
-
         self.debug_text = ""
         if shell_cmd:
             self.debug_text += "[shell_cmd: " + shell_cmd + "]\n"
         else:
             self.debug_text += "[cmd: " + str(cmd) + "]\n"
-        self.debug_text += "[dir: " + str(os.getcwd()) + "]\n"
+        self.debug_text += "[dir: " + str(working_dir or os.getcwd()) + "]\n"
         if "PATH" in merged_env:
             self.debug_text += "[path: " + str(merged_env["PATH"]) + "]"
         else:
@@ -274,7 +569,7 @@ class SuperExecCommand(sublime_plugin.WindowCommand, ProcessListener):
 
         try:
             # Forward kwargs to AsyncProcess
-            self.proc = AsyncProcess(cmd, shell_cmd, merged_env, self, **kwargs)
+            self.proc = AsyncProcess(cmd, shell_cmd, merged_env, self, working_dir, **kwargs)
 
             self.text_queue_lock.acquire()
             try:
@@ -318,12 +613,30 @@ class SuperExecCommand(sublime_plugin.WindowCommand, ProcessListener):
             else:
                 self.text_queue.append(str)
 
+            self.text_queue_size += len(str)
+
+            if proc:
+                proc.telemetry.queued(len(self.text_queue))
+
+                # Instead of queueing output without bound, the process is
+                # held up by its pipes until the view caught up. Paused and
+                # resumed under the lock, so that the two keep their order.
+                if self.throttled is None and self.text_queue_size >= self.MAX_QUEUED:
+                    self.throttled = proc
+                    proc.pause_reading()
+
         finally:
             self.text_queue_lock.release()
 
         if was_empty:
             sublime.set_timeout(self.service_text_queue, 0)
 
+    def resume_throttled(self):
+        # Called with the text_queue_lock held.
+        if self.throttled:
+            self.throttled.resume_reading()
+            self.throttled = None
+
     def service_text_queue(self):
         self.text_queue_lock.acquire()
 
@@ -334,31 +647,67 @@ class SuperExecCommand(sublime_plugin.WindowCommand, ProcessListener):
                 # the text_queue
                 return
 
-            characters = self.text_queue.popleft()
+            # Take as many blocks as the last appends suggest fit in a frame.
+            budget = max(self.BLOCK_SIZE, int(self.FRAME_BUDGET / self.append_cost))
+            blocks = [self.text_queue.popleft()]
+            size = len(blocks[0])
+
+            while self.text_queue and size + len(self.text_queue[0]) <= budget:
+                blocks.append(self.text_queue.popleft())
+                size += len(blocks[-1])
+
+            self.text_queue_size -= size
+
+            if self.text_queue_size < self.MAX_QUEUED // 2:
+                self.resume_throttled()
+
             is_empty = (len(self.text_queue) == 0)
+            proc = self.text_queue_proc
         finally:
             self.text_queue_lock.release()
 
+        try:
+            self.show_text(proc, "".join(blocks))
+        finally:
+            # An error in the view or the matcher must not stop the queue
+            # from draining.
+            if not is_empty:
+                sublime.set_timeout(self.service_text_queue, 1)
+            else:
+                self.finish_telemetry()
+
+    def show_text(self, proc, characters):
+        begin = time.perf_counter()
+
         self.output_view.run_command(
             'append',
             {'characters': characters, 'force': True, 'scroll_to_end': True})
 
+        appended = time.perf_counter()
 
+        if characters:
+            cost = (appended - begin) / len(characters)
+            self.append_cost = 0.75 * self.append_cost + 0.25 * cost
 
+        if proc:
+            proc.telemetry.append_time += appended - begin
+            proc.telemetry.drained(len(characters))
 
-        if self.show_errors_inline and characters.find('\n') >= 0:
-            errs = self.output_view.find_all_results_with_text()
-            errs_by_file = {}
-            for file, line, column, text in errs:
-                if file not in errs_by_file:
-                    errs_by_file[file] = []
-                errs_by_file[file].append((line, column, text))
-            self.errs_by_file = errs_by_file
-
+        if self.result_matcher.feed(characters) and self.show_errors_inline:
+            self.errs_by_file = self.result_matcher.errs_by_file
             self.update_phantoms()
 
-        if not is_empty:
-            sublime.set_timeout(self.service_text_queue, 1)
+        if proc:
+            proc.telemetry.parse_time += time.perf_counter() - appended
+
+    def finish_telemetry(self):
+        # The record is written once the output has reached the view, so
+        # that the drain rate covers the whole build.
+        proc = self.finishing
+
+        if proc:
+            self.finishing = None
+            proc.telemetry.finish(proc.exit_code(), proc.killed)
 
     def finish(self, proc):
         if not self.quiet:
@@ -370,96 +719,63 @@ class SuperExecCommand(sublime_plugin.WindowCommand, ProcessListener):
                 self.append_string(proc, "[Finished in %.1fs with exit code %d]\n" % (elapsed, exit_code))
                 self.append_string(proc, self.debug_text)
 
+        if self.finishing:
+            self.finish_telemetry()
+
+        self.finishing = proc
+
+        self.text_queue_lock.acquire()
+        try:
+            is_empty = (len(self.text_queue) == 0)
+        finally:
+            self.text_queue_lock.release()
+
+        if is_empty:
+            self.finish_telemetry()
+
         if proc != self.proc:
             return
 
-        errs = self.output_view.find_all_results()
-        if len(errs) == 0:
+        errs = self.result_matcher.count
+        if errs == 0:
             sublime.status_message("Build finished")
         else:
-            sublime.status_message("Build finished with %d errors" % len(errs))
+            sublime.status_message("Build finished with %d errors" % errs)
 
-    def on_data(self, proc, data):
-        try:
-            characters = data.decode(self.encoding)
-        except:
-            characters = "[Decode error - output not " + self.encoding + "]\n"
-            proc = None
+    def on_data(self, proc, data, stream=None):
+        begin = time.perf_counter()
 
-        # Normalize newlines, Sublime Text always uses a single \n separator
-        # in memory.
-        characters = characters.replace('\r\n', '\n').replace('\r', '\n')
+        decoder = proc.decoders.get(stream)
 
-        self.append_string(proc, characters)
+        if decoder is None:
+            decoder = StreamDecoder(self.encoding)
+            proc.decoders[stream] = decoder
 
-    def on_finished(self, proc):
-        sublime.set_timeout(functools.partial(self.finish, proc), 0)
+        characters = decoder.decode(data)
 
-    def update_phantoms(self):
-        stylesheet = '''
-            <style>
-                div.error {
-                    padding: 0.4rem 0 0.4rem 0.7rem;
-                    margin: 0.2rem 0;
-                    border-radius: 2px;
-                }
-
-                div.error span.message {
-                    padding-right: 0.7rem;
-                }
-
-                div.error a {
-                    text-decoration: inherit;
-                    padding: 0.35rem 0.7rem 0.45rem 0.8rem;
-                    position: relative;
-                    bottom: 0.05rem;
-                    border-radius: 0 2px 2px 0;
-                    font-weight: bold;
-                }
-                html.dark div.error a {
-                    background-color: #00000018;
-                }
-                html.light div.error a {
-                    background-color: #ffffff18;
-                }
-            </style>
-        '''
-
-        for file, errs in self.errs_by_file.items():
-            view = self.window.find_open_file(file)
-            if view:
-
-                buffer_id = view.buffer_id()
-                if buffer_id not in self.phantom_sets_by_buffer:
-                    phantom_set = sublime.PhantomSet(view, "exec")
-                    self.phantom_sets_by_buffer[buffer_id] = phantom_set
-                else:
-                    phantom_set = self.phantom_sets_by_buffer[buffer_id]
+        proc.telemetry.received(0, characters.count("\n"))
+        proc.telemetry.filter_time += time.perf_counter() - begin
 
-                phantoms = []
+        if characters:
+            self.append_string(proc, characters)
+
+    def on_finished(self, proc):
+        # Flush whatever the decoders still hold, e.g. a trailing \r.
+        for decoder in proc.decoders.values():
+            characters = decoder.decode(b"", True)
 
-                for line, column, text in errs:
-                    pt = view.text_point(line - 1, 0)
-                    phantoms.append(sublime.Phantom(
-                        sublime.Region(pt, view.line(pt).b),
-                        ('<body id=inline-error>' + stylesheet +
-                            '<div class="error">' +
-                            '<span class="message">' + html.escape(text, quote=False) + '</span>' +
-                            '<a href=hide>' + chr(0x00D7) + '</a></div>' +
-                            '</body>'),
-                        sublime.LAYOUT_BELOW,
-                        on_navigate=self.on_phantom_navigate))
+            if characters:
+                self.append_string(proc, characters)
 
-                phantom_set.update(phantoms)
+        sublime.set_timeout(functools.partial(self.finish, proc), 0)
+
+    def update_phantoms(self):
+        self.phantoms.update(self.window, self.errs_by_file)
 
     def hide_phantoms(self):
-        for file, errs in self.errs_by_file.items():
-            view = self.window.find_open_file(file)
-            if view:
-                view.erase_phantoms("exec")
+        self.phantoms.clear()
 
         self.errs_by_file = {}
-        self.phantom_sets_by_buffer = {}
         self.show_errors_inline = False
 
     def on_phantom_navigate(self, url):
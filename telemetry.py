@@ -0,0 +1,165 @@
+import sublime, sublime_plugin
+import threading
+import time
+import json
+import os
+
+# MinionBuildTelemetryCommand is registered from this module only.
+__all__ = ["BuildTelemetry"]
+
+class BuildTelemetry:
+    """
+    Timings and throughput of a single build. Finished builds are appended
+    to a JSONL history file in the cache directory.
+    """
+
+    HISTORY_FILE = "Minion/telemetry.jsonl"
+    HISTORY_TAIL = 2**16
+
+    def __init__(self, command, working_dir = None):
+        self.mutex = threading.Lock()
+        self.command = command
+        self.working_dir = working_dir
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.spawn_latency = None
+        self.first_byte = None
+        self.bytes = 0
+        self.lines = 0
+        self.peak_queue_depth = 0
+        self.filter_time = 0.0
+        self.append_time = 0.0
+        self.parse_time = 0.0
+        self.drained_chars = 0
+        self.drain_begin = None
+        self.drain_end = None
+
+    def spawned(self):
+        self.spawn_latency = time.perf_counter() - self.start
+
+    def received(self, size, lines, queue_depth = 0):
+        with self.mutex:
+            if self.first_byte == None:
+                self.first_byte = time.perf_counter() - self.start
+
+            self.bytes += size
+            self.lines += lines
+            self.peak_queue_depth = max(self.peak_queue_depth, queue_depth)
+
+    def queued(self, queue_depth):
+        with self.mutex:
+            self.peak_queue_depth = max(self.peak_queue_depth, queue_depth)
+
+    def drained(self, size):
+        """Counts `size` characters that have reached the output view."""
+        now = time.perf_counter()
+
+        with self.mutex:
+            if self.drain_begin == None:
+                self.drain_begin = now
+
+            self.drain_end = now
+            self.drained_chars += size
+
+    def finish(self, return_code, cancelled = False):
+        elapsed = time.perf_counter() - self.start
+        drain_time = self.drain_end - self.drain_begin if self.drain_begin != None else 0.0
+
+        record = {
+            "time" : self.timestamp,
+            "cmd" : self.command,
+            "dir" : self.working_dir,
+            "return_code" : return_code,
+            "cancelled" : cancelled,
+            "elapsed" : elapsed,
+            "spawn_latency" : self.spawn_latency,
+            "first_byte" : self.first_byte,
+            "bytes" : self.bytes,
+            "lines" : self.lines,
+            "bytes_per_second" : self.bytes / elapsed if elapsed else 0.0,
+            "lines_per_second" : self.lines / elapsed if elapsed else 0.0,
+            "filter_time" : self.filter_time,
+            "append_time" : self.append_time,
+            "parse_time" : self.parse_time,
+            "peak_queue_depth" : self.peak_queue_depth,
+            "drained_chars" : self.drained_chars,
+            "drain_rate" : self.drained_chars / drain_time if drain_time else None }
+
+        try:
+            path = BuildTelemetry.history_path()
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+
+            with open(path, "a") as file:
+                file.write(json.dumps(record) + "\n")
+        except OSError as error:
+            print("Unable to write build telemetry: {}".format(error))
+
+        return record
+
+    @staticmethod
+    def history_path():
+        return os.path.join(sublime.cache_path(), BuildTelemetry.HISTORY_FILE)
+
+    @staticmethod
+    def history(count):
+        """Returns the last `count` records of the history file."""
+        try:
+            with open(BuildTelemetry.history_path(), "rb") as file:
+                file.seek(0, os.SEEK_END)
+                begin = max(0, file.tell() - BuildTelemetry.HISTORY_TAIL)
+                file.seek(begin)
+                lines = file.read().decode("utf-8", "replace").splitlines()
+
+                # The first line is likely cut in half.
+                if begin != 0:
+                    lines = lines[1:]
+        except OSError:
+            return []
+
+        records = []
+
+        for line in lines[-count:]:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                pass
+
+        return records
+
+    @staticmethod
+    def format(record):
+        def ms(value):
+            return "{:.1f}ms".format(value * 1000) if value != None else "-"
+
+        return "\n".join([
+            "[{}] {} (exit code {}{})".format(
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record["time"])),
+                record["cmd"],
+                record["return_code"],
+                ", cancelled" if record["cancelled"] else ""),
+            "    elapsed {:.2f}s, spawn {}, first byte {}".format(
+                record["elapsed"], ms(record["spawn_latency"]), ms(record["first_byte"])),
+            "    {} bytes, {} lines, {:.0f} bytes/s, {:.0f} lines/s".format(
+                record["bytes"], record["lines"],
+                record["bytes_per_second"], record["lines_per_second"]),
+            "    filter {}, ui append {}, error parse {}, peak queue depth {}".format(
+                ms(record["filter_time"]), ms(record["append_time"]),
+                ms(record["parse_time"]), record["peak_queue_depth"]),
+            "    ui drain {}".format(
+                "{:.0f} chars/s".format(record["drain_rate"]) if record.get("drain_rate") else "-"),
+            ""])
+
+class MinionBuildTelemetryCommand(sublime_plugin.WindowCommand):
+    def run(self, count = 20):
+        records = BuildTelemetry.history(count)
+
+        view = self.window.new_file()
+        view.set_scratch(True)
+        view.set_name("Build Telemetry")
+
+        if records:
+            text = "\n".join(BuildTelemetry.format(record) for record in reversed(records))
+        else:
+            text = "No builds recorded yet.\n"
+
+        view.run_command("append", { "characters" : text })